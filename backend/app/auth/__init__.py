@@ -5,7 +5,9 @@ from typing import cast
 from jose import JWTError, jwt as jose_jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from .. import models, db
 from .local_jwt import (
@@ -24,35 +26,61 @@ from .oidc import (
     require_oidc_scopes,
     get_required_scopes,
 )
+from .user_cache import AuthenticatedUser, authenticated_user_cache
 
 # ===== HYBRID AUTH =====
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials (tried both local JWT and OIDC)",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
 def get_current_user_hybrid(
     token: str = Depends(oauth2_scheme),
     db_session: Session = Depends(db.get_db),
-) -> models.User:
+) -> AuthenticatedUser:
     """
     Hybrid authentication dependency.
     Accepts both local JWT and OIDC access tokens.
     
     Flow:
-        1. Try to validate as local JWT (SECRET_KEY, HS256)
-        2. If fails, try to validate as OIDC (JWKS, RS256, scopes)
-        3. If both fail, raise 401
+        0. Return the cached user snapshot if this token was seen recently
+        1. Read the unverified header once and dispatch on `alg`
+        2. Local algorithm (HS256) -> validate as local JWT (SECRET_KEY)
+        3. Anything else -> validate as OIDC (JWKS, RS256, scopes)
+        4. If validation fails, raise 401
+
+    Returns a detached AuthenticatedUser snapshot, not an ORM object.
     """
-    # ===== TRY LOCAL JWT FIRST =====
-    # Why first? Because in development, most requests use local JWT
-    # and it's faster to validate (no JWKS fetch)
+    # ===== CACHED USER =====
+    cached_user = authenticated_user_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+    generation = authenticated_user_cache.generation()
+
+    # ===== DISPATCH ON TOKEN TYPE =====
+    # Entra tokens are RS256 with a kid, local tokens use ALGORITHM.
+    # Routing on the header avoids a failing HS256 decode for every OIDC token.
+    from .local_jwt import SECRET_KEY, ALGORITHM
+
     try:
-        # 1. Try local JWT first (fast path)
-        from .local_jwt import SECRET_KEY, ALGORITHM
-
-        # Decode and validate local JWT
-        payload = jose_jwt.decode(
-            token,
-            cast(str, SECRET_KEY),
-            algorithms=[cast(str, ALGORITHM)],
-        )
-        
+        header = jose_jwt.get_unverified_header(token)
+    except JWTError:
+        raise _credentials_exception()
+
+    if header.get("alg") == ALGORITHM:
+        # ===== LOCAL JWT =====
+        try:
+            payload = jose_jwt.decode(
+                token,
+                cast(str, SECRET_KEY),
+                algorithms=[cast(str, ALGORITHM)],
+            )
+        except JWTError:
+            raise _credentials_exception()
+
         # Extract username from 'sub' claim
         username = payload.get("sub")
         if isinstance(username, str) and username:
@@ -61,19 +89,15 @@ def get_current_user_hybrid(
 
             # Check if user exists and is not disabled
             if user and not getattr(user, "is_disabled", False):
-                return user
-    except JWTError:
-        # Local JWT validation failed, try OIDC
-        pass
-    except Exception:
-        # Unexpected error (DB issue, etc) - also try OIDC as fallback
-        pass
-    
-    # ===== TRY OIDC TOKEN =====
-        # 2. If fails, try OIDC (slower, needs JWKS fetch)
+                snapshot = AuthenticatedUser.from_model(user)
+                authenticated_user_cache.put(token, snapshot, payload.get("exp"), generation)
+                return snapshot
+        raise _credentials_exception()
+
+    # ===== OIDC TOKEN =====
     try:
-        # Validate OIDC token (includes signature and claims check)
-        claims = validate_oidc_token(token)
+        # Validate OIDC token (signature verified once per token, then cached until exp)
+        claims = validate_oidc_token(token, header=header)
         
         # Check required scopes
         required_scopes = get_required_scopes()
@@ -82,21 +106,83 @@ def get_current_user_hybrid(
 
         # Get or create user from OIDC claims
         user = get_or_create_oidc_user(db_session, claims)
-        return user
+        snapshot = AuthenticatedUser.from_model(user)
+        authenticated_user_cache.put(token, snapshot, claims.get("exp"), generation)
+        return snapshot
     except HTTPException:
         # Re-raise explicit HTTP exceptions (like 403 Forbidden)
         raise
     except Exception:
         # OIDC validation failed
-        pass
-    
-    # ===== BOTH FAILED =====
-        # 3. If both fail, raise 401
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials (tried both local JWT and OIDC)",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+        raise _credentials_exception()
+
+def _resolve_oidc_user(token: str, header: dict, generation: int) -> AuthenticatedUser:
+    """OIDC-vägen för den asynkrona varianten; körs i trådpoolen med en egen session."""
+    db_session = db.SessionLocal()
+    try:
+        claims = validate_oidc_token(token, header=header)
+        required_scopes = get_required_scopes()
+        if required_scopes:
+            require_oidc_scopes(claims, required_scopes)
+        user = get_or_create_oidc_user(db_session, claims)
+        snapshot = AuthenticatedUser.from_model(user)
+        authenticated_user_cache.put(token, snapshot, claims.get("exp"), generation)
+        return snapshot
+    finally:
+        db_session.close()
+
+
+async def get_current_user_hybrid_async(
+    token: str = Depends(oauth2_scheme),
+    db_session=Depends(db.get_async_db),
+) -> AuthenticatedUser:
+    """
+    Async variant of get_current_user_hybrid for the async API router.
+
+    Cache hits and local JWTs never leave the event loop. OIDC validation
+    (JWKS fetch, user provisioning) stays sync and runs in the threadpool.
+    """
+    cached_user = authenticated_user_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+    generation = authenticated_user_cache.generation()
+
+    from .local_jwt import SECRET_KEY, ALGORITHM
+
+    try:
+        header = jose_jwt.get_unverified_header(token)
+    except JWTError:
+        raise _credentials_exception()
+
+    if header.get("alg") == ALGORITHM:
+        try:
+            payload = jose_jwt.decode(
+                token,
+                cast(str, SECRET_KEY),
+                algorithms=[cast(str, ALGORITHM)],
+            )
+        except JWTError:
+            raise _credentials_exception()
+
+        username = payload.get("sub")
+        if isinstance(username, str) and username:
+            result = await db_session.execute(select(models.User).where(models.User.username == username))
+            user = result.scalars().first()
+            if user and not getattr(user, "is_disabled", False):
+                # Lat laddning fungerar inte i en AsyncSession; admin_units hämtas bara när den används
+                if user.role == "unit_admin":
+                    await db_session.run_sync(lambda _session: user.admin_units)
+                snapshot = AuthenticatedUser.from_model(user)
+                authenticated_user_cache.put(token, snapshot, payload.get("exp"), generation)
+                return snapshot
+        raise _credentials_exception()
+
+    try:
+        return await run_in_threadpool(_resolve_oidc_user, token, header, generation)
+    except HTTPException:
+        raise
+    except Exception:
+        raise _credentials_exception()
 
 __all__ = [
     # Local JWT
@@ -116,4 +202,7 @@ __all__ = [
     
     # Hybrid
     "get_current_user_hybrid",
+    "get_current_user_hybrid_async",
+    "AuthenticatedUser",
+    "authenticated_user_cache",
 ]
@@ -27,9 +27,28 @@ try:
 except ValueError as exc:
     raise RuntimeError("ACCESS_TOKEN_EXPIRE_MINUTES must be an integer") from exc
 
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+# Första schemat används för nya hashar; övriga accepteras men räknas som
+# föråldrade och hashas om vid nästa lyckade inloggning (verify_and_update).
+PASSWORD_HASH_SCHEMES = [
+    scheme.strip()
+    for scheme in os.getenv("PASSWORD_HASH_SCHEMES", "sha256_crypt").split(",")
+    if scheme.strip()
+]
+PASSWORD_HASH_ROUNDS = os.getenv("PASSWORD_HASH_ROUNDS")
+
+_pwd_context_options: dict = {}
+if PASSWORD_HASH_ROUNDS:
+    # min/max_rounds gör att hashar med annat antal rundor också räknas som föråldrade
+    _pwd_context_options[f"{PASSWORD_HASH_SCHEMES[0]}__default_rounds"] = int(PASSWORD_HASH_ROUNDS)
+    _pwd_context_options[f"{PASSWORD_HASH_SCHEMES[0]}__min_rounds"] = int(PASSWORD_HASH_ROUNDS)
+    _pwd_context_options[f"{PASSWORD_HASH_SCHEMES[0]}__max_rounds"] = int(PASSWORD_HASH_ROUNDS)
+
+pwd_context = CryptContext(schemes=PASSWORD_HASH_SCHEMES, deprecated="auto", **_pwd_context_options)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Markör för konton utan lösenord (t.ex. OIDC-användare). Matchar aldrig någon hash.
+UNUSABLE_PASSWORD = "!"
+
 
 class Token(BaseModel):
     access_token: str
@@ -41,9 +60,18 @@ class TokenData(BaseModel):
 
 
 def verify_password(plain_password, hashed_password):
+    if not hashed_password or hashed_password == UNUSABLE_PASSWORD:
+        return False
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password, hashed_password):
+    """Returnerar (giltigt, ny_hash). ny_hash är satt om lagrad hash bör uppgraderas."""
+    if not hashed_password or hashed_password == UNUSABLE_PASSWORD:
+        return False, None
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -1,16 +1,21 @@
+import hashlib
 import logging
 import os
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from typing import Optional, cast
 import requests
 from dotenv import load_dotenv
 from fastapi import HTTPException, status
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from .. import models
-from .local_jwt import get_password_hash
+from .local_jwt import UNUSABLE_PASSWORD
 
 load_dotenv()
 
@@ -20,9 +25,19 @@ OIDC_AUDIENCE = os.getenv("OIDC_AUDIENCE")  # API App ID URI or client id
 OIDC_JWKS_URL = os.getenv("OIDC_JWKS_URL")  # Entra JWKS endpoint
 OIDC_REQUIRED_SCOPES = os.getenv("OIDC_REQUIRED_SCOPES")
 OIDC_JWKS_CACHE_TTL_SECONDS = os.getenv("OIDC_JWKS_CACHE_TTL_SECONDS", "3600")
+OIDC_JWKS_MIN_REFETCH_SECONDS = os.getenv("OIDC_JWKS_MIN_REFETCH_SECONDS", "60")
+OIDC_CLAIMS_CACHE_MAX_ENTRIES = os.getenv("OIDC_CLAIMS_CACHE_MAX_ENTRIES", "1024")
 
 logger = logging.getLogger(__name__)
 _jwks_cache: dict[str, object] = {}
+_jwks_refresh_lock = threading.Lock()
+# Verifierade claims per SHA-256 av token, giltiga till tokenens exp
+_claims_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_claims_cache_lock = threading.Lock()
+# oid -> users.id för redan lösta OIDC-användare (snabbväg i get_or_create_oidc_user)
+OIDC_IDENTITY_MAP_MAX_ENTRIES = int(os.getenv("OIDC_IDENTITY_MAP_MAX_ENTRIES", "4096"))
+_oidc_identity_map: "OrderedDict[str, str]" = OrderedDict()
+_oidc_identity_lock = threading.Lock()
 
 
 OIDC_USER_OVERRIDES = {
@@ -50,49 +65,140 @@ def _parse_csv_env(value: str | None) -> list[str]:
     return [item.strip() for item in value.split(",") if item.strip()]
 
 
-def _get_jwks() -> dict:
-    now = time.time()
-    cached = _jwks_cache.get("jwks")
-    expires_at = _jwks_cache.get("expires_at")
-    if cached and isinstance(expires_at, (int, float)) and now < expires_at:
-        return cast(dict, cached)
+def _fetch_jwks() -> dict:
+    response = requests.get(cast(str, OIDC_JWKS_URL), timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+
+def _parse_jwks(jwks: dict) -> dict[str, Key]:
+    # Nycklarna byggs en gång per hämtning i stället för vid varje validering
+    keys: dict[str, Key] = {}
+    for key_data in jwks.get("keys", []):
+        kid = key_data.get("kid")
+        if not kid:
+            continue
+        try:
+            keys[kid] = jwk.construct(key_data, algorithm=key_data.get("alg", "RS256"))
+        except Exception as exc:
+            logger.warning("Skipping unparseable JWKS key %s", kid, exc_info=exc)
+    return keys
+
 
+def _refresh_jwks() -> None:
+    """Hämta och installera JWKS. Anroparen måste hålla _jwks_refresh_lock."""
+    # Tidpunkten för senaste försöket styr rate-limit för okända kid
+    _jwks_cache["fetched_at"] = time.time()
     try:
-        response = requests.get(cast(str, OIDC_JWKS_URL), timeout=5)
-        response.raise_for_status()
-        jwks = response.json()
-        ttl_seconds = int(OIDC_JWKS_CACHE_TTL_SECONDS)
-        _jwks_cache["jwks"] = jwks
-        _jwks_cache["expires_at"] = now + max(ttl_seconds, 60)
-        return jwks
+        keys = _parse_jwks(_fetch_jwks())
     except Exception as exc:
-        if cached:
+        if _jwks_cache.get("keys"):
             logger.warning("JWKS fetch failed; using cached JWKS", exc_info=exc)
-            return cast(dict, cached)
+            _jwks_cache["refresh_at"] = time.time() + int(OIDC_JWKS_MIN_REFETCH_SECONDS)
+            return
         raise
+    now = time.time()
+    ttl_seconds = max(int(OIDC_JWKS_CACHE_TTL_SECONDS), 60)
+    _jwks_cache["keys"] = keys
+    _jwks_cache["expires_at"] = now + ttl_seconds
+    # Förnya i bakgrunden när 80 % av TTL har gått, före själva utgången
+    _jwks_cache["refresh_at"] = now + ttl_seconds * 0.8
+
+
+def _background_refresh() -> None:
+    try:
+        _refresh_jwks()
+    except Exception as exc:
+        logger.warning("Background JWKS refresh failed", exc_info=exc)
+    finally:
+        _jwks_refresh_lock.release()
 
 
-def validate_oidc_token(token: str) -> dict:
+def _get_signing_keys() -> dict[str, Key]:
+    """
+    Returnera nycklarna indexerade på kid.
+
+    Bara första laddningen blockerar. Därefter startas förnyelsen i en
+    bakgrundstråd när refresh_at passerats, och anroparen får de befintliga
+    nycklarna under tiden (stale-while-revalidate). Lås gör att högst en
+    hämtning pågår åt gången.
+    """
+    keys = cast(Optional[dict], _jwks_cache.get("keys"))
+    if keys is None:
+        with _jwks_refresh_lock:
+            if _jwks_cache.get("keys") is None:
+                _refresh_jwks()
+        return cast(dict, _jwks_cache["keys"])
+
+    refresh_at = cast(float, _jwks_cache.get("refresh_at", 0))
+    if time.time() >= refresh_at and _jwks_refresh_lock.acquire(blocking=False):
+        threading.Thread(target=_background_refresh, name="jwks-refresh", daemon=True).start()
+    return keys
+
+
+def _refetch_for_unknown_kid() -> dict[str, Key]:
+    """
+    Okänt kid betyder oftast nyckelrotation. Hämta om direkt, men högst en
+    gång per OIDC_JWKS_MIN_REFETCH_SECONDS så att skräp-token inte kan
+    trigga en hämtning per anrop.
+    """
+    min_interval = int(OIDC_JWKS_MIN_REFETCH_SECONDS)
+    with _jwks_refresh_lock:
+        fetched_at = cast(float, _jwks_cache.get("fetched_at", 0))
+        if time.time() - fetched_at >= min_interval:
+            _refresh_jwks()
+    return cast(dict, _jwks_cache.get("keys") or {})
+
+
+def _get_cached_claims(token_key: str) -> Optional[dict]:
+    with _claims_cache_lock:
+        entry = _claims_cache.get(token_key)
+        if entry is None:
+            return None
+        expires_at, claims = entry
+        if time.time() >= expires_at:
+            del _claims_cache[token_key]
+            return None
+        _claims_cache.move_to_end(token_key)
+        return claims
+
+
+def _cache_claims(token_key: str, claims: dict) -> None:
+    exp = claims.get("exp")
+    max_entries = int(OIDC_CLAIMS_CACHE_MAX_ENTRIES)
+    if not isinstance(exp, (int, float)) or max_entries <= 0:
+        return
+    with _claims_cache_lock:
+        _claims_cache[token_key] = (float(exp), claims)
+        _claims_cache.move_to_end(token_key)
+        while len(_claims_cache) > max_entries:
+            _claims_cache.popitem(last=False)
+
+
+def validate_oidc_token(token: str, header: Optional[dict] = None) -> dict:
     # 0) Måste ha config
     if not (OIDC_ISSUER and OIDC_AUDIENCE and OIDC_JWKS_URL):
         raise RuntimeError("Missing OIDC config")
 
+    # Redan verifierad token: signaturen kontrolleras en gång per token, inte per anrop
+    token_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    cached_claims = _get_cached_claims(token_key)
+    if cached_claims is not None:
+        return cached_claims
+
     # 1) Läs header för att hitta kid (vilken nyckel som används)
-    header = jwt.get_unverified_header(token)
+    if header is None:
+        header = jwt.get_unverified_header(token)
     kid = header.get("kid")
     if not kid:
         raise JWTError("Missing kid")
 
-    # 2) Hämta JWKS (publika nycklar) från Entra
-    jwks = _get_jwks()
-
+    # 2) Hämta JWKS (publika nycklar, indexerade på kid) från Entra
     # 3) Leta upp rätt key baserat på kid
-    matched_key = None
-    for jwk in jwks.get("keys", []):
-        if jwk.get("kid") == kid:
-            matched_key = jwk
-            break
-    if not matched_key:
+    matched_key = _get_signing_keys().get(kid)
+    if matched_key is None:
+        matched_key = _refetch_for_unknown_kid().get(kid)
+    if matched_key is None:
         raise JWTError("No matching key found")
 
     # 4) Validate access token for this API
@@ -110,6 +216,7 @@ def validate_oidc_token(token: str) -> dict:
         if token_issuer not in allowed_issuers:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid issuer")
 
+    _cache_claims(token_key, claims)
     return claims
 
 
@@ -137,12 +244,125 @@ def first_non_empty_string(claims: dict, possible_keys: list[str]) -> str | None
     return None
 
 
+def _remember_identity(oidc_object_id: str, user_id: str) -> None:
+    with _oidc_identity_lock:
+        _oidc_identity_map[oidc_object_id] = user_id
+        _oidc_identity_map.move_to_end(oidc_object_id)
+        while len(_oidc_identity_map) > OIDC_IDENTITY_MAP_MAX_ENTRIES:
+            _oidc_identity_map.popitem(last=False)
+
+
+def _forget_identity(oidc_object_id: str) -> None:
+    with _oidc_identity_lock:
+        _oidc_identity_map.pop(oidc_object_id, None)
+
+
+def _set_if_changed(user: "models.User", field: str, value) -> bool:
+    if getattr(user, field) == value:
+        return False
+    setattr(user, field, value)
+    return True
+
+
+def _link_oidc_identity(user: "models.User", oidc_object_id: str, tenant_id: str | None, override: dict | None) -> bool:
+    changed = _set_if_changed(user, "oidc_id", oidc_object_id)
+    changed |= _set_if_changed(user, "auth_method", "oidc")
+    changed |= _set_if_changed(user, "oidc_tenant_id", tenant_id)
+    if override:
+        changed |= _set_if_changed(user, "role", override.get("role", user.role))
+        changed |= _set_if_changed(user, "unit_id", override.get("unit_id", user.unit_id))
+        if override.get("name"):
+            changed |= _set_if_changed(user, "name", override.get("name"))
+    return changed
+
+
+def _commit_user(db_session: Session, user: "models.User") -> None:
+    # Use try-except to handle concurrent update/linking attempts gracefully:
+    # another request has likely already made the same change.
+    try:
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+    db_session.refresh(user)
+
+
+def _resolve_existing_user(
+    db_session: Session,
+    candidates: list["models.User"],
+    oidc_object_id: str,
+    tenant_id: str | None,
+    email_address: str | None,
+    username: str,
+    override: dict | None,
+) -> Optional["models.User"]:
+    """Välj bland kandidaterna i samma prioritetsordning som tidigare: oidc_id, email, username."""
+    by_oidc = next((u for u in candidates if u.oidc_id == oidc_object_id), None)
+    by_email = next((u for u in candidates if email_address and u.email == email_address), None)
+    by_username = next((u for u in candidates if u.username == username), None)
+
+    # 2) Finns redan användare länkad via oidc_id?
+    if by_oidc is not None:
+        if getattr(by_oidc, "is_disabled", False):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
+        # [FIX] If existing user has no unit, assign to Unit 3
+        if not by_oidc.unit_id:
+            by_oidc.unit_id = "u3"
+            _commit_user(db_session, by_oidc)
+        return by_oidc
+
+    # 2b/3) Matcha/länka via email
+    # Säkerhetskrav: email måste matcha och tenant_id måste matcha (om den finns i DB)
+    if by_email is not None:
+        if getattr(by_email, "is_disabled", False):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
+        # Skydd: samma email får inte redan vara länkad till en annan OIDC-id
+        existing_oidc_id = cast(Optional[str], by_email.oidc_id)
+        if existing_oidc_id is not None and existing_oidc_id != oidc_object_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Email already linked to another OIDC user",
+            )
+        existing_tenant_id = getattr(by_email, "oidc_tenant_id", None)
+        if existing_tenant_id and tenant_id and existing_tenant_id != tenant_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Tenant mismatch")
+        if _link_oidc_identity(by_email, oidc_object_id, tenant_id, override):
+            _commit_user(db_session, by_email)
+        return by_email
+
+    # 3b) Om användaren finns via username men saknar OIDC-länk, länka den
+    if by_username is not None:
+        if getattr(by_username, "is_disabled", False):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
+        existing_oidc_id = cast(Optional[str], by_username.oidc_id)
+        if existing_oidc_id is not None and existing_oidc_id != oidc_object_id:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Username already linked to another OIDC user",
+            )
+        if _link_oidc_identity(by_username, oidc_object_id, tenant_id, override):
+            _commit_user(db_session, by_username)
+        return by_username
+
+    return None
+
+
 def get_or_create_oidc_user(db_session: Session, token_claims: dict) -> "models.User":
     # 1) Stabilt OIDC-id: oid (Entra Object ID), annars sub
     oidc_object_id = first_non_empty_string(token_claims, ["oid", "sub"])
     if not oidc_object_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing oid/sub")
 
+    # Snabbväg: känt oid -> primärnyckeluppslag, inga commits
+    with _oidc_identity_lock:
+        known_user_id = _oidc_identity_map.get(oidc_object_id)
+    if known_user_id is not None:
+        known_user = db_session.get(models.User, known_user_id)
+        if known_user is not None and known_user.oidc_id == oidc_object_id and known_user.unit_id:
+            if getattr(known_user, "is_disabled", False):
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
+            return known_user
+        _forget_identity(oidc_object_id)
+
     # Om man vill kunna stödja fler tenants i framtiden
     tenant_id = first_non_empty_string(token_claims, ["tid"])
     email_address = first_non_empty_string(token_claims, ["preferred_username", "email", "upn"])
@@ -150,123 +370,18 @@ def get_or_create_oidc_user(db_session: Session, token_claims: dict) -> "models.
     username = (email_address or oidc_object_id).strip().lower()
     override = OIDC_USER_OVERRIDES.get(username)
 
-    # 2) Finns redan användare länkad via oidc_id?
-    existing_user_by_oidc = (
-        db_session.query(models.User)
-        .filter(models.User.oidc_id == oidc_object_id)
-        .first()
-    )
-    if existing_user_by_oidc:
-        if getattr(existing_user_by_oidc, "is_disabled", False):
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
-        
-        # [FIX] If existing user has no unit, assign to Unit 3
-        # Use a nested try/except to handle concurrent update collisions gracefully
-        if not existing_user_by_oidc.unit_id:
-            try:
-                existing_user_by_oidc.unit_id = "u3"
-                db_session.commit()
-                db_session.refresh(existing_user_by_oidc)
-            except Exception as e:
-                db_session.rollback()
-                # If it fails, likely another concurrent request already fixed it.
-                # Just refresh and continue.
-                db_session.refresh(existing_user_by_oidc)
-            
-        return existing_user_by_oidc
-
-    # 2b) Om användaren finns via email/UPN men saknar OIDC-länk, länka den
-    # Säkerhetskrav: email måste matcha och tenant_id måste matcha (om den finns i DB)
-    if email_address:
-        existing_user_by_email_only = (
-            db_session.query(models.User)
-            .filter(models.User.email == email_address)
-            .first()
-        )
-        if existing_user_by_email_only is not None and not getattr(existing_user_by_email_only, "oidc_id", None):
-            if getattr(existing_user_by_email_only, "is_disabled", False):
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
-            existing_tenant_id = getattr(existing_user_by_email_only, "oidc_tenant_id", None)
-            if existing_tenant_id and tenant_id and existing_tenant_id != tenant_id:
-                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Tenant mismatch")
-            setattr(existing_user_by_email_only, "oidc_id", oidc_object_id)
-            setattr(existing_user_by_email_only, "auth_method", "oidc")
-            setattr(existing_user_by_email_only, "oidc_tenant_id", tenant_id)
-            if override:
-                setattr(existing_user_by_email_only, "role", override.get("role", existing_user_by_email_only.role))
-                setattr(existing_user_by_email_only, "unit_id", override.get("unit_id", existing_user_by_email_only.unit_id))
-                if override.get("name"):
-                    setattr(existing_user_by_email_only, "name", override.get("name"))
-            db_session.commit()
-            db_session.refresh(existing_user_by_email_only)
-            return existing_user_by_email_only
-
-    # 3) Försök matcha/länka via email
+    # En fråga för alla tre matchningsvägarna (oidc_id, email, username)
+    match_conditions = [models.User.oidc_id == oidc_object_id, models.User.username == username]
     if email_address:
-        existing_user_by_email = (
-            db_session.query(models.User)
-            .filter(models.User.email == email_address)
-            .first()
-        )
-        if existing_user_by_email is not None:
-            if getattr(existing_user_by_email, "is_disabled", False):
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
-            # Skydd: samma email får inte redan vara länkad till en annan OIDC-id
-            existing_oidc_id = cast(Optional[str], existing_user_by_email.oidc_id)
-            if existing_oidc_id is not None and existing_oidc_id != oidc_object_id:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Email already linked to another OIDC user",
-                )
-            # Länka kontot
-            # Use try-except to handle concurrent linking attempt
-            try:
-                existing_user_by_email.oidc_id = oidc_object_id
-                existing_user_by_email.auth_method = "oidc"
-                existing_user_by_email.oidc_tenant_id = tenant_id
-                if override:
-                    existing_user_by_email.role = override.get("role", existing_user_by_email.role)
-                    existing_user_by_email.unit_id = override.get("unit_id", existing_user_by_email.unit_id)
-                    if override.get("name"):
-                        existing_user_by_email.name = override.get("name")
-                db_session.commit()
-                db_session.refresh(existing_user_by_email)
-            except Exception as e:
-                db_session.rollback()
-                db_session.refresh(existing_user_by_email) # Refresh to get the latest state after rollback
-                
-            return existing_user_by_email
+        match_conditions.append(models.User.email == email_address)
+    candidates = db_session.query(models.User).filter(or_(*match_conditions)).all()
 
-    # 3b) Om användaren finns via username men saknar OIDC-länk, länka den
-    existing_user_by_username = (
-        db_session.query(models.User)
-        .filter(models.User.username == username)
-        .first()
+    existing_user = _resolve_existing_user(
+        db_session, candidates, oidc_object_id, tenant_id, email_address, username, override
     )
-    if existing_user_by_username is not None:
-        if getattr(existing_user_by_username, "is_disabled", False):
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
-        existing_oidc_id = cast(Optional[str], existing_user_by_username.oidc_id)
-        if existing_oidc_id is not None and existing_oidc_id != oidc_object_id:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Username already linked to another OIDC user",
-            )
-        try:
-            existing_user_by_username.oidc_id = oidc_object_id
-            existing_user_by_username.auth_method = "oidc"
-            existing_user_by_username.oidc_tenant_id = tenant_id
-            if override:
-                existing_user_by_username.role = override.get("role", existing_user_by_username.role)
-                existing_user_by_username.unit_id = override.get("unit_id", existing_user_by_username.unit_id)
-                if override.get("name"):
-                    existing_user_by_username.name = override.get("name")
-            db_session.commit()
-            db_session.refresh(existing_user_by_username)
-        except Exception as e:
-            db_session.rollback()
-            db_session.refresh(existing_user_by_username)
-        return existing_user_by_username
+    if existing_user is not None:
+        _remember_identity(oidc_object_id, existing_user.id)
+        return existing_user
 
     # 4) Skapa ny användare
     created_user = models.User(
@@ -275,7 +390,8 @@ def get_or_create_oidc_user(db_session: Session, token_claims: dict) -> "models.
         email=email_address,
         full_name=display_name,
         name=(override.get("name") if override and override.get("name") else (display_name or username)),
-        hashed_password=get_password_hash(uuid.uuid4().hex),
+        # OIDC-användare loggar aldrig in med lösenord; ingen dyr hashning behövs
+        hashed_password=UNUSABLE_PASSWORD,
         avatar=f"https://api.dicebear.com/7.x/avataaars/svg?seed={username}",
         role=(override.get("role") if override else "staff"),
         auth_method="oidc",
@@ -304,6 +420,7 @@ def get_or_create_oidc_user(db_session: Session, token_claims: dict) -> "models.
         if existing_user_after_collision is not None:
             return existing_user_after_collision
         raise
+    _remember_identity(oidc_object_id, created_user.id)
     return created_user
 
 
@@ -0,0 +1,92 @@
+"""
+Begränsad worker-pool för lösenordshashning.
+
+sha256_crypt med hundratusentals rundor är CPU-tungt. Körs det direkt i en
+`async def`-route står event-loopen still för alla andra requests under tiden.
+Poolen flyttar arbetet till processer (standard) eller trådar och har en
+kögräns: är poolen full avvisas anropet direkt med PasswordPoolSaturated
+i stället för att köa obegränsat.
+
+`thread` avlastar inte event-loopen: passlib håller GIL:en under hashningen.
+Det läget finns bara för miljöer utan processpool (standard på Vercel).
+
+Processerna startas med `spawn`, inte `fork`: en forkad worker ärver serverns
+lyssnande socket och signalhanterare och kan bli kvar och hålla porten efter
+att servern stoppats. Skript som loggar in via appen (TestClient) behöver därför
+`if __name__ == "__main__":`, som skripten i scripts/.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from . import local_jwt
+
+PASSWORD_HASH_POOL = os.getenv("PASSWORD_HASH_POOL", "thread" if os.getenv("VERCEL") else "process")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Max antal hashningar som får köra eller vänta samtidigt
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+
+
+class PasswordPoolSaturated(Exception):
+    pass
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    # Modulnivå-funktion så att den kan picklas till en processpool
+    return local_jwt.verify_and_update_password(plain_password, hashed_password)
+
+
+class PasswordHashPool:
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        # Skapas först vid behov så att import (och serverless cold start) inte startar workers
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="password-hash",
+                    )
+            return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise PasswordPoolSaturated()
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), _verify_and_update, plain_password, hashed_password
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+password_hash_pool = PasswordHashPool(PASSWORD_HASH_POOL, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
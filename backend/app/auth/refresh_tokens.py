@@ -0,0 +1,115 @@
+"""
+Refresh-token med rotation och återanvändningsdetektering.
+
+Ett refresh-token är en slumpad opak sträng; bara dess SHA-256 lagras.
+Varje användning roterar token: det gamla markeras som ersatt och ett nytt
+i samma familj lämnas ut. Används ett redan ersatt eller återkallat token
+igen tyder det på att det läckt, och hela familjen återkallas.
+Inget av detta rör lösenordshashningen.
+"""
+import hashlib
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from .. import models
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _invalid_refresh_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def issue_refresh_token(db_session: Session, user_id: str, family_id: Optional[str] = None) -> tuple[str, models.RefreshToken]:
+    """Skapa ett nytt refresh-token. Anroparen committar."""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    grant = models.RefreshToken(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        family_id=family_id or uuid.uuid4().hex,
+        token_hash=hash_refresh_token(token),
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    db_session.add(grant)
+    return token, grant
+
+
+def revoke_family(db_session: Session, family_id: str) -> None:
+    db_session.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+
+def revoke_user_tokens(db_session: Session, user_id: str) -> int:
+    result = db_session.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.user_id == user_id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    return result.rowcount or 0
+
+
+def rotate_refresh_token(db_session: Session, token: str) -> tuple[models.User, str]:
+    """
+    Byt ett giltigt refresh-token mot ett nytt i samma familj.
+    Returnerar (användare, nytt refresh-token) och committar.
+    """
+    grant = db_session.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == hash_refresh_token(token),
+    ).first()
+    if grant is None:
+        raise _invalid_refresh_token()
+
+    if grant.revoked_at is not None or grant.replaced_by is not None:
+        # Återanvändning: någon har en kopia av ett redan använt token
+        revoke_family(db_session, grant.family_id)
+        db_session.commit()
+        raise _invalid_refresh_token()
+
+    if grant.expires_at <= datetime.utcnow():
+        raise _invalid_refresh_token()
+
+    user = db_session.query(models.User).filter(models.User.id == grant.user_id).first()
+    if user is None or getattr(user, "is_disabled", False):
+        revoke_family(db_session, grant.family_id)
+        db_session.commit()
+        raise _invalid_refresh_token()
+
+    new_token, new_grant = issue_refresh_token(db_session, user.id, grant.family_id)
+    # Villkorlig UPDATE: bara en av två samtidiga rotationer av samma token vinner
+    claimed = db_session.execute(
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.id == grant.id,
+            models.RefreshToken.replaced_by.is_(None),
+            models.RefreshToken.revoked_at.is_(None),
+        )
+        .values(replaced_by=new_grant.id)
+    )
+    if claimed.rowcount != 1:
+        db_session.rollback()
+        revoke_family(db_session, grant.family_id)
+        db_session.commit()
+        raise _invalid_refresh_token()
+
+    db_session.commit()
+    return user, new_token
@@ -0,0 +1,159 @@
+"""
+Cache för autentiserade användare i get_current_user_hybrid.
+
+Nyckeln är en SHA-256 av bearer-token. Värdet är en fristående, oföränderlig
+ögonblicksbild av användaren (AuthenticatedUser), så en träff behöver varken
+avkoda token eller fråga databasen. Ändringar av en User via ORM:en tar bort
+användarens poster vid flush och igen efter commit (se eventen längst ner).
+Varje borttagning ökar en generation; en miss som läste användaren före
+ändringen får inte lägga in den gamla raden efteråt (som i DayScheduleCache).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .. import models
+
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "1024"))
+AUTH_USER_CACHE_TTL_SECONDS = int(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    id: str
+    username: str
+    name: str
+    role: str
+    unit_id: Optional[str]
+    auth_method: Optional[str]
+    admin_unit_ids: tuple[str, ...]
+    is_disabled: bool
+
+    @classmethod
+    def from_model(cls, user: "models.User") -> "AuthenticatedUser":
+        # admin_units laddas bara för unit_admin, övriga roller använder den inte
+        admin_unit_ids: tuple[str, ...] = ()
+        if user.role == "unit_admin":
+            admin_unit_ids = tuple(unit.id for unit in user.admin_units)
+        return cls(
+            id=user.id,
+            username=user.username,
+            name=user.name,
+            role=user.role,
+            unit_id=user.unit_id,
+            auth_method=user.auth_method,
+            admin_unit_ids=admin_unit_ids,
+            is_disabled=bool(user.is_disabled),
+        )
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class AuthenticatedUserCache:
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, AuthenticatedUser]]" = OrderedDict()
+        self._keys_by_user: dict[str, set[str]] = {}
+        # Ökar vid varje invalidering; put med äldre generation ignoreras
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        """Läses före databasfrågan vid en miss och skickas med till put."""
+        with self._lock:
+            return self._generation
+
+    def get(self, token: str) -> Optional[AuthenticatedUser]:
+        key = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if time.time() >= expires_at:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(
+        self,
+        token: str,
+        user: AuthenticatedUser,
+        token_expires_at: Optional[float] = None,
+        generation: Optional[int] = None,
+    ) -> None:
+        if self.max_entries <= 0 or user.is_disabled:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        # Aldrig längre än token själv är giltig
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        key = token_digest(token)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = (expires_at, user)
+            self._keys_by_user.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1].id
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+
+authenticated_user_cache = AuthenticatedUserCache(AUTH_USER_CACHE_MAX_ENTRIES, AUTH_USER_CACHE_TTL_SECONDS)
+
+
+_PENDING_EVICTIONS = "auth_user_cache_evictions"
+
+
+# after_update körs även när bara admin_units-kopplingen ändrats
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _evict_changed_user(mapper, connection, target):
+    authenticated_user_cache.invalidate_user(target.id)
+    # Flush sker före commit: en samtidig miss kan fortfarande läsa den gamla raden
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_EVICTIONS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_committed_users(session):
+    for user_id in session.info.pop(_PENDING_EVICTIONS, ()):
+        authenticated_user_cache.invalidate_user(user_id)
@@ -0,0 +1,159 @@
+"""
+Ändringslogg för scheman (`schedule_changes`), grunden för /schedule/changes.
+
+Varje skrivväg för TaskTemplate och TaskInstance lägger till en rad här i
+samma transaktion som själva ändringen. Det görs explicit i routrarna och i
+task_import, eftersom upserts och Core-insert inte går via ORM-event. `seq`
+är klientens cursor: en poll utan ändringar är en indexerad fråga på
+(unit_id, seq).
+
+I Postgres tilldelas seq vid insert, inte vid commit. Utan mer skulle en
+transaktion som committar efter en senare kunna hamna bakom en cursor som
+klienten redan fått. Därför tar varje skrivning ett transaktionslås per
+enhet (pg_advisory_xact_lock) innan ändringen loggas: inom en enhet dras
+seq och committas i samma ordning, och en cursor hoppar aldrig över en
+ändring. SQLite har bara en skrivare åt gången och behöver inget lås.
+"""
+import os
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import Date, DateTime, TextClause, func, insert, literal, select, text
+
+from . import models
+
+SCHEDULE_CHANGES_MAX_ITEMS = int(os.getenv("SCHEDULE_CHANGES_MAX_ITEMS", "500"))
+
+KIND_TEMPLATE = "template"
+KIND_INSTANCE = "instance"
+OP_UPSERT = "upsert"
+OP_DELETE = "delete"
+
+CHANGE_COLUMNS = ["unit_id", "kind", "op", "template_id", "date", "changed_at"]
+
+
+def change_row(unit_id: Optional[str], kind: str, op: str, template_id: str, day: Optional[date] = None) -> dict:
+    return {
+        "unit_id": unit_id,
+        "kind": kind,
+        "op": op,
+        "template_id": template_id,
+        "date": day,
+        "changed_at": datetime.utcnow(),
+    }
+
+
+def lock_units(dialect_name: str, unit_ids) -> Optional[TextClause]:
+    """
+    Postgres: lås enheterna till commit innan deras ändringar loggas. Sorterade,
+    så att två transaktioner med flera enheter låser i samma ordning.
+    None för andra databaser eller inga enheter.
+    """
+    units = sorted({unit_id for unit_id in unit_ids if unit_id})
+    if dialect_name != "postgresql" or not units:
+        return None
+    return text(
+        "SELECT pg_advisory_xact_lock(hashtext(unit_id)) FROM unnest(CAST(:unit_ids AS text[])) AS unit_id"
+    ).bindparams(unit_ids=units)
+
+
+def lock_template_unit(dialect_name: str, template_id: str) -> Optional[TextClause]:
+    """Som lock_units, för mallens enhet när den inte är känd i förväg."""
+    if dialect_name != "postgresql":
+        return None
+    return text(
+        "SELECT pg_advisory_xact_lock(hashtext(unit_id)) FROM task_templates WHERE id = :template_id"
+    ).bindparams(template_id=template_id)
+
+
+def insert_changes(returning_seq: bool = False):
+    """
+    Insert för en eller flera change_row-dicts (executemany). Med
+    `returning_seq` returneras (seq, template_id, date) per rad, i godtycklig
+    ordning: krav på radordning gör att SQLAlchemy skriver en rad per sats.
+    """
+    table = models.ScheduleChange.__table__
+    stmt = insert(table)
+    if returning_seq:
+        stmt = stmt.returning(table.c.seq, table.c.template_id, table.c.date)
+    return stmt
+
+
+def log_instance_change(template_id: str, day: date):
+    """
+    Loggar en instansändring med mallens enhet och returnerar (unit_id, seq),
+    i en sats (INSERT ... SELECT ... RETURNING). Finns inte mallen skrivs inget.
+    """
+    templates = models.TaskTemplate.__table__
+    table = models.ScheduleChange.__table__
+    source = select(
+        templates.c.unit_id,
+        literal(KIND_INSTANCE),
+        literal(OP_UPSERT),
+        templates.c.id,
+        literal(day, Date),
+        literal(datetime.utcnow(), DateTime),
+    ).where(templates.c.id == template_id)
+    return insert(table).from_select(CHANGE_COLUMNS, source).returning(table.c.unit_id, table.c.seq)
+
+
+def latest_seq_stmt(unit_id: str):
+    return select(func.coalesce(func.max(models.ScheduleChange.seq), 0)).where(
+        models.ScheduleChange.unit_id == unit_id,
+    )
+
+
+def changes_stmt(unit_id: str, since: int, limit: int = SCHEDULE_CHANGES_MAX_ITEMS):
+    # Instansens nuvarande läge i samma fråga; en rad extra avslöjar om det finns fler
+    change = models.ScheduleChange
+    instance = models.TaskInstance
+    return select(
+        change.seq,
+        change.kind,
+        change.op,
+        change.template_id,
+        change.date,
+        instance.status,
+        instance.signed_by,
+        instance.signed_at,
+        instance.report_data,
+    ).outerjoin(
+        instance,
+        (change.kind == KIND_INSTANCE)
+        & (instance.template_id == change.template_id)
+        & (instance.date == change.date),
+    ).where(
+        change.unit_id == unit_id,
+        change.seq > since,
+    ).order_by(change.seq).limit(limit + 1)
+
+
+def changes_body(rows, since: int, limit: int = SCHEDULE_CHANGES_MAX_ITEMS) -> dict:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Flera ändringar av samma mall/instans slås ihop till den senaste
+    latest = {}
+    for row in rows:
+        key = (row.kind, row.template_id, row.date)
+        latest.pop(key, None)
+        latest[key] = row
+
+    return {
+        "cursor": rows[-1].seq if rows else since,
+        "hasMore": has_more,
+        "changes": [
+            {
+                "seq": row.seq,
+                "kind": row.kind,
+                "op": row.op,
+                "templateId": row.template_id,
+                "date": row.date,
+                "status": row.status,
+                "signedBy": row.signed_by,
+                "signedAt": row.signed_at,
+                "reportData": row.report_data,
+            }
+            for row in latest.values()
+        ],
+    }
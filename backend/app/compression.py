@@ -0,0 +1,75 @@
+"""
+Komprimering av svar: brotli om klienten accepterar `br`, annars gzip.
+
+Bygger på Starlettes GZipMiddleware (samma tröskel, undantagna innehållstyper
+och streaming), men väljer en brotli-responder när `Accept-Encoding`
+innehåller `br` och paketet brotli finns installerat. Svar under
+RESPONSE_COMPRESSION_MIN_BYTES skickas okomprimerade; text/event-stream
+komprimeras aldrig.
+"""
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli saknas: bara gzip
+    brotli = None
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() in ("1", "true", "yes")
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Låg kvalitet räcker för JSON och kostar en bråkdel av CPU-tiden för kvalitet 11
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def _accepts_brotli(accept_encoding: str) -> bool:
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() == "br":
+            # "br;q=0" betyder att klienten uttryckligen inte vill ha brotli
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = BROTLI_QUALITY, **kwargs) -> None:
+        super().__init__(app, minimum_size, **kwargs)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        if more_body:
+            return self._compressor.process(body) + self._compressor.flush()
+        return self._compressor.process(body) + self._compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(
+        self,
+        app,
+        minimum_size: int = RESPONSE_COMPRESSION_MIN_BYTES,
+        compresslevel: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+    ) -> None:
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and brotli is not None:
+            if _accepts_brotli(Headers(scope=scope).get("Accept-Encoding", "")):
+                responder = BrotliResponder(
+                    self.app,
+                    self.minimum_size,
+                    quality=self.brotli_quality,
+                    exclude_content_types=self.exclude_content_types,
+                )
+                await responder(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
@@ -3,37 +3,148 @@ from pathlib import Path
 
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 
 SQLITE_DB_PATH = Path(__file__).resolve().parents[1] / "sql_app.db"
 DEFAULT_SQLITE_URL = f"sqlite:///{SQLITE_DB_PATH}"
 DATABASE_URL = os.getenv("DATABASE_URL", DEFAULT_SQLITE_URL)
 
+# Poolinställningar för Postgres.
+# queue: vanlig pool i processen (långlivad server)
+# null:  ingen egen pool, varje session öppnar/stänger en anslutning. För serverless
+#        och externa poolers (t.ex. Supabase/PgBouncer på port 6543). Standard på Vercel.
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "null" if os.getenv("VERCEL") else "queue")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+
+def _postgres_pool_options() -> dict:
+    if DB_POOL_MODE == "null":
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": QueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False, "timeout": 30},
     )
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **_postgres_pool_options())
 
 
-if DATABASE_URL.startswith("sqlite"):
-    @event.listens_for(engine, "connect")
+def _configure_sqlite(sync_engine) -> None:
+    """
+    WAL, och BEGIN före SAVEPOINT. pysqlite/aiosqlite skickar BEGIN först vid
+    första skrivningen; kommer en SAVEPOINT innan öppnar den den riktiga
+    transaktionen och RELEASE committar den. Då blir t.ex. batch-signeringen
+    en commit (och en WAL-fsync) per post i stället för en transaktion.
+
+    Vanliga läsningar lämnas utanför transaktion som förut: en läs-
+    transaktion som senare skriver får "database is locked" direkt (utan
+    väntan) om någon annan hunnit committa emellan.
+    """
+    @event.listens_for(sync_engine, "connect")
     def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA journal_mode=WAL")
         cursor.execute("PRAGMA synchronous=NORMAL")
         cursor.close()
 
+    @event.listens_for(sync_engine, "savepoint")
+    def begin_before_savepoint(connection, name):
+        if connection.connection.driver_connection.in_transaction:
+            return
+        # IMMEDIATE tar skrivlåset direkt (med väntan), så att läsningar inne i
+        # savepointen inte behöver uppgraderas. Direkt på DBAPI-markören: inga
+        # cursor-event, så frågebudget och mätvärden räknar bara riktiga satser.
+        cursor = connection.connection.dbapi_connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.close()
+
+
+if DATABASE_URL.startswith("sqlite"):
+    _configure_sqlite(engine)
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
+# Asynkron motor (aiosqlite/asyncpg) för de asynkrona routerna. Skapas bara när
+# DB_ASYNC är på, så att drivrutinerna inte krävs annars.
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+
+
+def _async_database_url(url: str) -> str:
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    if DATABASE_URL.startswith("sqlite"):
+        async_engine = create_async_engine(
+            _async_database_url(DATABASE_URL),
+            connect_args={"timeout": 30},
+        )
+        _configure_sqlite(async_engine.sync_engine)
+    else:
+        async_pool_options = _postgres_pool_options()
+        # AsyncAdaptedQueuePool i stället för QueuePool
+        if async_pool_options["poolclass"] is QueuePool:
+            del async_pool_options["poolclass"]
+        else:
+            # PgBouncer i transaktionsläge klarar inte asyncpg:s prepared statement-cache
+            async_pool_options["connect_args"] = {"statement_cache_size": 0}
+        async_engine = create_async_engine(_async_database_url(DATABASE_URL), **async_pool_options)
+
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def pool_status() -> dict:
+    """Aktuellt läge för anslutningspoolen, för att se när den tar slut."""
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=DB_MAX_OVERFLOW,
+        )
+    return status
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database is disabled; set DB_ASYNC=true")
+    async with AsyncSessionLocal() as db:
+        yield db
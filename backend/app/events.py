@@ -0,0 +1,248 @@
+"""
+Pub/sub för schemaändringar per enhet, grunden för /schedule/stream (SSE).
+
+Skrivvägarna publicerar efter commit med `publish(unit_id, event)`; det går
+att anropa från trådpoolen (synkrona handlers) och från event-loopen.
+Händelserna har samma form som posterna i /schedule/changes, inklusive seq,
+så att klienten kan flytta fram sin cursor.
+
+Brokern är utbytbar via `EVENT_BROKER`: `memory` (standard, bara den egna
+processen) eller `modul:Klass` för en egen implementation av `Broker`, t.ex.
+mot Redis eller Postgres LISTEN/NOTIFY när appen körs med flera workers.
+
+Strömmen kräver inloggning och behörighet till enheten. Antalet samtidiga
+strömmar begränsas både totalt (SSE_MAX_SUBSCRIBERS) och per användare
+(SSE_MAX_SUBSCRIBERS_PER_USER), så att en klient inte kan ta alla platser.
+
+Varje prenumerant har en begränsad kö (SSE_QUEUE_MAX_EVENTS). Blir den full
+töms den och klienten får en `resync`-händelse i stället, så att en långsam
+klient aldrig kan få serverns minne att växa; klienten hämtar då ikapp via
+/schedule/changes.
+"""
+import asyncio
+import importlib
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Optional
+
+from . import changes, payload
+
+EVENT_BROKER = os.getenv("EVENT_BROKER", "memory")
+SSE_QUEUE_MAX_EVENTS = int(os.getenv("SSE_QUEUE_MAX_EVENTS", "100"))
+SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "1000"))
+SSE_MAX_SUBSCRIBERS_PER_USER = int(os.getenv("SSE_MAX_SUBSCRIBERS_PER_USER", "5"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# Proxies och serverless bryter långa svar; EventSource återansluter själv efter SSE_RETRY_MS
+SSE_MAX_CONNECTION_SECONDS = float(os.getenv("SSE_MAX_CONNECTION_SECONDS", "300"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+RESYNC_EVENT = {"type": "resync"}
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    """En klients kö. Läses på den event-loop som skapade den."""
+
+    def __init__(self, unit_id: str, user_id: str, max_events: int = SSE_QUEUE_MAX_EVENTS):
+        self.unit_id = unit_id
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_events)
+        self.dropped = 0
+
+    def offer(self, event: dict) -> None:
+        # Körs på prenumerantens loop
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            event = RESYNC_EVENT
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Nästa händelse, eller None om inget kom inom `timeout` sekunder."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker(ABC):
+    """Gränssnitt för pub/sub. `publish` måste vara trådsäker och får inte blockera."""
+
+    @abstractmethod
+    def publish(self, unit_id: str, event: dict) -> None:
+        ...
+
+    @abstractmethod
+    def subscribe(self, unit_id: str, user_id: str) -> Subscription:
+        """Kastar TooManySubscribers när gränsen totalt eller per användare är nådd."""
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription) -> None:
+        ...
+
+    def accepting(self, user_id: Optional[str] = None) -> bool:
+        """Plats för en ström till, totalt eller (med user_id) för användaren."""
+        return True
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InProcessBroker(Broker):
+    def __init__(
+        self,
+        max_subscribers: int = SSE_MAX_SUBSCRIBERS,
+        max_per_user: int = SSE_MAX_SUBSCRIBERS_PER_USER,
+    ):
+        self.max_subscribers = max_subscribers
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._count = 0
+        self._per_user: dict[str, int] = {}
+        self.published = 0
+
+    def publish(self, unit_id: str, event: dict) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(unit_id, ()))
+            self.published += 1
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Loopen är stängd; prenumerationen städas bort när strömmen avslutas
+                pass
+
+    def subscribe(self, unit_id: str, user_id: str) -> Subscription:
+        subscription = Subscription(unit_id, user_id)
+        with self._lock:
+            if not self._accepting(user_id):
+                raise TooManySubscribers()
+            self._subscriptions.setdefault(unit_id, set()).add(subscription)
+            self._count += 1
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.unit_id)
+            if subscriptions is None or subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.unit_id]
+            self._count -= 1
+            remaining = self._per_user[subscription.user_id] - 1
+            if remaining:
+                self._per_user[subscription.user_id] = remaining
+            else:
+                del self._per_user[subscription.user_id]
+
+    def accepting(self, user_id: Optional[str] = None) -> bool:
+        with self._lock:
+            return self._accepting(user_id)
+
+    def _accepting(self, user_id: Optional[str]) -> bool:
+        if self._count >= self.max_subscribers:
+            return False
+        return user_id is None or self._per_user.get(user_id, 0) < self.max_per_user
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": self._count,
+                "users": len(self._per_user),
+                "units": len(self._subscriptions),
+                "published": self.published,
+            }
+
+
+def _load_broker(name: str) -> Broker:
+    if name == "memory":
+        return InProcessBroker()
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise RuntimeError(f"EVENT_BROKER must be 'memory' or 'module:Class', got {name!r}")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+broker: Broker = _load_broker(EVENT_BROKER)
+
+
+def publish(unit_id: Optional[str], event: dict) -> None:
+    if unit_id:
+        broker.publish(unit_id, event)
+
+
+def instance_event(seq: int, template_id: str, day: date, instance) -> dict:
+    """`instance` är den lagrade raden (upsertens RETURNING), inte requestens fält."""
+    return {
+        "type": "change",
+        "seq": seq,
+        "kind": changes.KIND_INSTANCE,
+        "op": changes.OP_UPSERT,
+        "templateId": template_id,
+        "date": day,
+        "status": instance.status,
+        "signedBy": instance.signed_by,
+        "signedAt": instance.signed_at,
+        "reportData": instance.report_data,
+    }
+
+
+def template_event(seq: int, template_id: str, valid_on_date: Optional[date], op: str) -> dict:
+    return {
+        "type": "change",
+        "seq": seq,
+        "kind": changes.KIND_TEMPLATE,
+        "op": op,
+        "templateId": template_id,
+        "date": valid_on_date,
+        "status": None,
+        "signedBy": None,
+        "signedAt": None,
+        "reportData": None,
+    }
+
+
+def _format_event(event: dict) -> bytes:
+    return b"event: " + event["type"].encode() + b"\ndata: " + payload.encode(event) + b"\n\n"
+
+
+async def sse_stream(
+    unit_id: str,
+    user_id: str,
+    max_seconds: float = SSE_MAX_CONNECTION_SECONDS,
+    keepalive_seconds: float = SSE_KEEPALIVE_SECONDS,
+):
+    """
+    Händelser för en enhet som text/event-stream. Prenumerationen skapas och
+    tas bort här i generatorn, så att den alltid städas när klienten kopplar ner.
+    """
+    yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+    try:
+        subscription = broker.subscribe(unit_id, user_id)
+    except TooManySubscribers:
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_seconds
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            event = await subscription.get(min(keepalive_seconds, remaining))
+            if event is not None:
+                yield _format_event(event)
+            elif loop.time() < deadline:
+                yield b": keepalive\n\n"
+    finally:
+        broker.unsubscribe(subscription)
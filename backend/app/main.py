@@ -1,10 +1,32 @@
+import logging
+import time
+
+# Referenspunkt för kallstartsmätningen: från import till första svar
+_IMPORT_STARTED = time.perf_counter()
+
+import os
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import local_auth, oidc_auth, api_router
-from . import models, db, seed
+from starlette.datastructures import MutableHeaders
+from .routers import local_auth, oidc_auth, api_router, api_async_router
+from . import db, seed, migrations, metrics, compression, events
+from .auth.password_pool import password_hash_pool
+from .query_budget import budget
+from .auth.user_cache import authenticated_user_cache
+from .schedule_cache import day_schedule_cache
+
+# auto:  skapa tabeller, migrera och seeda vid start (lokal utveckling)
+# check: jämför bara lagrad schema-fingerprint (serverless, standard på Vercel; migrera med manage.py)
+# off:   ingen databaskontroll alls vid start
+DB_STARTUP_MODE = os.getenv("DB_STARTUP_MODE", "check" if os.getenv("VERCEL") else "auto")
 
-# Create tables
-models.Base.metadata.create_all(bind=db.engine)
+if DB_STARTUP_MODE == "auto":
+    # Create tables
+    migrations.migrate(db.engine)
+elif DB_STARTUP_MODE == "check":
+    migrations.check_schema(db.engine)
 
 app = FastAPI()
 
@@ -17,17 +39,131 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# DB_ASYNC: de asynkrona routerna registreras först och tar över sina routes;
+# övriga (t.ex. /tasks/import) faller igenom till den synkrona routern.
+api_routers = [api_router.router]
+if db.DB_ASYNC:
+    api_routers.insert(0, api_async_router.router)
+
+# Komprimering (brotli/gzip) för svar över RESPONSE_COMPRESSION_MIN_BYTES
+if compression.RESPONSE_COMPRESSION:
+    app.add_middleware(compression.CompressionMiddleware)
+
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(db.engine)
+    if db.async_engine is not None:
+        metrics.instrument_engine(db.async_engine.sync_engine)
+
 app.include_router(local_auth.router)
 app.include_router(oidc_auth.router)
-app.include_router(api_router.router)
+for router in api_routers:
+    app.include_router(router)
 app.include_router(local_auth.router, prefix="/api")
 app.include_router(oidc_auth.router, prefix="/api")
-app.include_router(api_router.router, prefix="/api")
+for router in api_routers:
+    app.include_router(router, prefix="/api")
+
+logger = logging.getLogger(__name__)
+
+_cold_start: dict[str, float] = {}
+
+
+class ColdStartMiddleware:
+    """
+    Ren ASGI-middleware som sätter Server-Timing på det första svaret.
+    Därefter skickas requests vidare direkt, även strömmande svar som SSE.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _cold_start:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and not _cold_start:
+                elapsed_ms = (time.perf_counter() - _IMPORT_STARTED) * 1000
+                _cold_start["ms"] = elapsed_ms
+                MutableHeaders(scope=message).append("Server-Timing", f"cold-start;dur={elapsed_ms:.1f}")
+                logger.info(
+                    "Cold start: %.1f ms from import to first response (DB_STARTUP_MODE=%s)",
+                    elapsed_ms, DB_STARTUP_MODE,
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+app.add_middleware(ColdStartMiddleware)
 
 @app.on_event("startup")
 def seed_on_startup():
-    seed.seed_data()
+    if DB_STARTUP_MODE == "auto":
+        seed.seed_data()
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    password_hash_pool.shutdown()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    if db.async_engine is not None:
+        await db.async_engine.dispose()
 
 @app.get("/")
+@budget(0)
 def read_root():
     return {"message": "Autopilot Planner API"}
+
+def _schedule_cache_metrics() -> dict:
+    stats = day_schedule_cache.stats()
+    return {(("stat", key),): value for key, value in stats.items()}
+
+
+def _db_pool_metrics() -> dict:
+    return {
+        (("stat", key),): value
+        for key, value in db.pool_status().items()
+        if isinstance(value, int)
+    }
+
+
+metrics.registry.register_collector(
+    "schedule_cache", "gauge", "Day schedule cache size, TTL and hit/miss/eviction/expiration counts", _schedule_cache_metrics,
+)
+metrics.registry.register_collector(
+    "auth_user_cache_entries", "gauge", "Cached authenticated users", lambda: {(): len(authenticated_user_cache)},
+)
+metrics.registry.register_collector(
+    "db_pool", "gauge", "SQLAlchemy connection pool state", _db_pool_metrics,
+)
+metrics.registry.register_collector(
+    "event_stream_subscribers", "gauge", "Open /schedule/stream subscriptions",
+    lambda: {(): events.broker.stats().get("subscribers", 0)},
+)
+metrics.registry.register_collector(
+    "password_hash_pending", "gauge", "Password hashes running or queued", lambda: {(): password_hash_pool.pending},
+)
+
+
+@app.get("/metrics", include_in_schema=False)
+@app.get("/api/metrics", include_in_schema=False)
+@budget(0)
+def get_metrics():
+    if not metrics.METRICS_ENABLED:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+@budget(0)
+def health():
+    return {
+        "status": "ok",
+        "startup_mode": DB_STARTUP_MODE,
+        "cold_start_ms": _cold_start.get("ms"),
+        "db_pool": db.pool_status(),
+        "db_async": db.DB_ASYNC,
+    }
@@ -0,0 +1,39 @@
+"""
+Databaskommandon som körs explicit i stället för vid varje kallstart.
+
+    python -m backend.app.manage migrate   # tabeller, migreringar, fingerprint
+    python -m backend.app.manage seed      # demo-data (hoppar över om redan seedad)
+    python -m backend.app.manage check     # jämför lagrad fingerprint med modellerna
+    python -m backend.app.manage dedupe    # ta bort dubbletter i task_instances
+"""
+import argparse
+import sys
+
+from . import db, migrations, seed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Databaskommandon för Rame Planner")
+    parser.add_argument("command", choices=["migrate", "seed", "check", "dedupe"])
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        fingerprint = migrations.migrate(db.engine)
+        print(f"Schema migrated ({fingerprint[:12]})")
+    elif args.command == "seed":
+        seed.seed_data()
+    elif args.command == "check":
+        try:
+            migrations.check_schema(db.engine)
+        except RuntimeError as exc:
+            print(exc)
+            return 1
+        print("Schema is up to date")
+    elif args.command == "dedupe":
+        removed = migrations.deduplicate_task_instances(db.engine)
+        print(f"Removed {removed} duplicate task instances")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
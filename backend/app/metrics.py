@@ -0,0 +1,211 @@
+"""
+Prometheus-mätvärden i textformat på /metrics, utan extra beroenden.
+
+Per request registreras latens per (metod, route-mall) och antal SQL-satser
+samt DB-tid, räknat via SQLAlchemy-event på motorerna. En request kostar
+några dict-uppslag och en lås-sektion; allt formateras först när /metrics
+hämtas. Cache- och poolvärden läses också först vid hämtning.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Requests som inte matchar någon route samlas under en etikett, så att
+# okända sökvägar inte skapar nya tidsserier
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestDbStats:
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+# Sätts av middlewaren; följer med in i trådpoolen och i async-motorns greenlets
+_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple, label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        # labels -> [räknare per hink..., +Inf, summa]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{{{base},le=\"{bound}\"}} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{{{base},le=\"+Inf\"}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{{{_format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_duration = Histogram(
+            "http_request_duration_seconds", "Request latency per route template",
+            LATENCY_BUCKETS, ("method", "route"),
+        )
+        self.requests = Counter(
+            "http_requests_total", "Requests per route template and status", ("method", "route", "status"),
+        )
+        self.db_statements = Histogram(
+            "http_request_db_statements", "SQL statements executed per request",
+            STATEMENT_BUCKETS, ("method", "route"),
+        )
+        self.db_seconds = Histogram(
+            "http_request_db_seconds", "Time spent in SQL per request",
+            DB_TIME_BUCKETS, ("method", "route"),
+        )
+        # name -> (typ, hjälptext, funktion som ger {etiketter: värde})
+        self._collectors: dict[str, tuple[str, str, Callable[[], dict]]] = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, db_stats: RequestDbStats) -> None:
+        labels = (method, route)
+        with self._lock:
+            self.request_duration.observe(labels, seconds)
+            self.requests.inc((method, route, status))
+            self.db_statements.observe(labels, db_stats.statements)
+            self.db_seconds.observe(labels, db_stats.seconds)
+
+    def register_collector(self, name: str, kind: str, help_text: str, collect: Callable[[], dict]) -> None:
+        """`collect` anropas bara vid hämtning och returnerar {(etikett, värde)-tupel: mätvärde}."""
+        self._collectors[name] = (kind, help_text, collect)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = (
+                self.request_duration.render()
+                + self.requests.render()
+                + self.db_statements.render()
+                + self.db_seconds.render()
+            )
+        for name, (kind, help_text, collect) in self._collectors.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in collect().items():
+                label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Ren ASGI-middleware (ingen BaseHTTPMiddleware) för att hålla kostnaden per request nere."""
+
+    def __init__(self, app, skip_paths: tuple[str, ...] = ("/metrics", "/api/metrics")):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        db_stats = RequestDbStats()
+        token = _request_db_stats.set(db_stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_db_stats.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path_format", None) or getattr(route, "path", None) or UNMATCHED_ROUTE
+            registry.observe_request(scope["method"], route_path, status_code, elapsed, db_stats)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_db_stats.get() is not None:
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db_stats = _request_db_stats.get()
+    if db_stats is None:
+        return
+    starts = conn.info.get("metrics_query_start")
+    if starts:
+        db_stats.seconds += time.perf_counter() - starts.pop()
+    db_stats.statements += 1
+
+
+def _handle_error(exception_context):
+    # Misslyckad sats: släng starttiden så att nästa sats inte mäts fel
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("metrics_query_start"):
+        connection.info["metrics_query_start"].pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
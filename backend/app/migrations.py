@@ -0,0 +1,161 @@
+"""
+Enkla, idempotenta schemamigreringar.
+
+`create_all` skapar bara tabeller som saknas, inte nya kolumner på befintliga
+tabeller. Funktionerna här lägger till sådant som tillkommit efter att en
+databas skapades och kan köras vid varje start.
+"""
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, func, inspect, select, update, delete
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import models
+
+BACKFILL_BATCH_SIZE = 500
+
+# Egen metadata så att create_all för appens modeller inte rör tabellen
+_version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    _version_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("fingerprint", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Kolumner som lagts till på task_templates efter första versionen
+TASK_TEMPLATE_META_COLUMNS = {
+    "time_start": "VARCHAR",
+    "time_end": "VARCHAR",
+    "requires_sign": "BOOLEAN",
+    "is_report_task": "BOOLEAN",
+    "report_type": "VARCHAR",
+    "assignee_id": "VARCHAR",
+}
+
+
+def _add_missing_columns(engine: Engine, table_name: str, columns: dict[str, str]) -> list[str]:
+    existing = {column["name"] for column in inspect(engine).get_columns(table_name)}
+    added = []
+    with engine.begin() as connection:
+        for name, sql_type in columns.items():
+            if name not in existing:
+                connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {name} {sql_type}")
+                added.append(name)
+    return added
+
+
+def _create_missing_indexes(engine: Engine, table) -> None:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def backfill_task_template_meta_columns(engine: Engine) -> int:
+    """Fyll de typade kolumnerna från meta_data för rader som inte fyllts än."""
+    table = models.TaskTemplate.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(
+            time_start=bindparam("time_start"),
+            time_end=bindparam("time_end"),
+            requires_sign=bindparam("requires_sign"),
+            is_report_task=bindparam("is_report_task"),
+            report_type=bindparam("report_type"),
+            assignee_id=bindparam("assignee_id"),
+        )
+    )
+
+    updated = 0
+    with engine.begin() as connection:
+        rows = connection.execute(
+            select(table.c.id, table.c.meta_data).where(table.c.requires_sign.is_(None))
+        ).all()
+        for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+            batch = [
+                {"_id": row.id, **models.meta_columns(row.meta_data)}
+                for row in rows[start:start + BACKFILL_BATCH_SIZE]
+            ]
+            connection.execute(stmt, batch)
+            updated += len(batch)
+    return updated
+
+
+def deduplicate_task_instances(engine: Engine) -> int:
+    """
+    Ta bort dubbletter av (template_id, date) innan det unika indexet skapas.
+    Den senast skrivna raden (högst id) behålls.
+    """
+    table = models.TaskInstance.__table__
+    keep_ids = select(func.max(table.c.id)).group_by(table.c.template_id, table.c.date)
+    with engine.begin() as connection:
+        result = connection.execute(delete(table).where(table.c.id.not_in(keep_ids)))
+    return result.rowcount or 0
+
+
+def run_migrations(engine: Engine) -> None:
+    _add_missing_columns(engine, "task_templates", TASK_TEMPLATE_META_COLUMNS)
+    _create_missing_indexes(engine, models.TaskTemplate.__table__)
+    backfill_task_template_meta_columns(engine)
+
+    index_names = {index["name"] for index in inspect(engine).get_indexes("task_instances")}
+    if "uq_task_instances_template_date" not in index_names:
+        deduplicate_task_instances(engine)
+        _create_missing_indexes(engine, models.TaskInstance.__table__)
+
+
+def schema_fingerprint() -> str:
+    """Hash av modellernas tabeller, kolumner och index. Ändras när schemat ändras."""
+    parts = []
+    for table in sorted(models.Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(f"table:{table.name}")
+        for column in table.columns:
+            parts.append(f"column:{column.name}:{column.type!r}:{column.nullable}:{column.primary_key}")
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            parts.append(f"index:{index.name}:{','.join(c.name for c in index.columns)}:{index.unique}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def read_stored_fingerprint(engine: Engine) -> str | None:
+    try:
+        with engine.connect() as connection:
+            return connection.execute(
+                select(schema_version.c.fingerprint).where(schema_version.c.id == 1)
+            ).scalar()
+    except SQLAlchemyError:
+        # Tabellen finns inte: databasen har aldrig migrerats explicit
+        return None
+
+
+def write_fingerprint(engine: Engine, fingerprint: str) -> None:
+    _version_metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(schema_version.delete())
+        connection.execute(
+            schema_version.insert().values(id=1, fingerprint=fingerprint, applied_at=datetime.utcnow())
+        )
+
+
+def migrate(engine: Engine) -> str:
+    """Skapa tabeller, kör migreringar och spara schemats fingerprint."""
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    fingerprint = schema_fingerprint()
+    if read_stored_fingerprint(engine) != fingerprint:
+        write_fingerprint(engine, fingerprint)
+    return fingerprint
+
+
+def check_schema(engine: Engine) -> None:
+    """Billig startkontroll: en fråga mot schema_version, ingen reflektion."""
+    stored = read_stored_fingerprint(engine)
+    expected = schema_fingerprint()
+    if stored != expected:
+        raise RuntimeError(
+            "Database schema is not up to date "
+            f"(stored {stored or 'none'}, expected {expected[:12]}). "
+            "Run: python -m backend.app.manage migrate"
+        )
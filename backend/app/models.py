@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, Text, JSON, Table
+import json
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Text, JSON, Table, Index, event
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -50,6 +51,48 @@ class TaskTemplate(Base):
     # to keep schema simple for prototype
     meta_data = Column(JSON, nullable=True) 
 
+    # Heta nycklar ur meta_data som riktiga kolumner så att SQL kan sortera
+    # och filtrera på dem. Hålls i synk med meta_data via meta_columns().
+    time_start = Column(String, nullable=True)
+    time_end = Column(String, nullable=True)
+    requires_sign = Column(Boolean, nullable=True)
+    is_report_task = Column(Boolean, nullable=True)
+    report_type = Column(String, nullable=True)
+    assignee_id = Column(String, nullable=True, index=True)
+
+    __table_args__ = (
+        Index("ix_task_templates_unit_time_start", "unit_id", "time_start"),
+        # Uppslag från bemanningen i /schedule/mine
+        Index("ix_task_templates_unit_role", "unit_id", "role_type"),
+    )
+
+
+def meta_columns(meta_data) -> dict:
+    """Typade kolumnvärden för TaskTemplate utifrån meta_data (dict eller JSON-sträng)."""
+    meta = meta_data or {}
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except json.JSONDecodeError:
+            meta = {}
+    if not isinstance(meta, dict):
+        meta = {}
+    return {
+        "time_start": meta.get("timeStart") or None,
+        "time_end": meta.get("timeEnd") or None,
+        "requires_sign": bool(meta.get("requiresSign")),
+        "is_report_task": bool(meta.get("isReportTask")),
+        "report_type": meta.get("reportType") or None,
+        "assignee_id": meta.get("assigneeId") or None,
+    }
+
+
+@event.listens_for(TaskTemplate, "before_insert")
+@event.listens_for(TaskTemplate, "before_update")
+def _sync_meta_columns(mapper, connection, target):
+    for key, value in meta_columns(target.meta_data).items():
+        setattr(target, key, value)
+
 class TaskInstance(Base):
     __tablename__ = "task_instances"
     id = Column(Integer, primary_key=True, index=True)
@@ -63,6 +106,43 @@ class TaskInstance(Base):
     template = relationship("TaskTemplate")
     signer = relationship("User")
 
+    # En instans per mall och dag; krävs för upsert i update_task_status
+    __table_args__ = (
+        Index("uq_task_instances_template_date", "template_id", "date", unique=True),
+    )
+
+class RosterEntry(Base):
+    """Vem som har ett pass (role_type) på en enhet en viss dag."""
+    __tablename__ = "roster_entries"
+    id = Column(Integer, primary_key=True, index=True)
+    unit_id = Column(String, ForeignKey("units.id"))
+    date = Column(Date)
+    role_type = Column(String)
+    user_id = Column(String, ForeignKey("users.id"))
+
+    __table_args__ = (
+        # En person per pass och dag; krävs för upsert i PUT /roster
+        Index("uq_roster_entries_unit_date_role", "unit_id", "date", "role_type", unique=True),
+        Index("ix_roster_entries_user_date", "user_id", "date"),
+    )
+
+class ScheduleChange(Base):
+    """En rad per ändring av mall eller instans; grunden för /schedule/changes."""
+    __tablename__ = "schedule_changes"
+    # Ökar monotont (AUTOINCREMENT i SQLite återanvänder aldrig ett värde); klientens cursor
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    unit_id = Column(String, nullable=True)
+    kind = Column(String)  # 'template', 'instance'
+    op = Column(String)  # 'upsert', 'delete'
+    template_id = Column(String)
+    date = Column(Date, nullable=True)  # instansens dag, eller mallens valid_on_date
+    changed_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_schedule_changes_unit_seq", "unit_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
 class Report(Base):
     __tablename__ = "reports"
     id = Column(Integer, primary_key=True, index=True)
@@ -72,3 +152,15 @@ class Report(Base):
     created_by = Column(String, ForeignKey("users.id"))
     
     author = relationship("User")
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    # Alla token som roterats fram ur samma inloggning delar family_id
+    family_id = Column(String, index=True)
+    token_hash = Column(String, unique=True, index=True)  # SHA-256, aldrig klartext
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime)
+    revoked_at = Column(DateTime, nullable=True)
+    replaced_by = Column(String, nullable=True)  # id för token som ersatte denna vid rotation
@@ -0,0 +1,135 @@
+"""
+Svarsformat för schemaendpoints: fälturval (`fields=`) och JSON eller
+MessagePack beroende på `Accept`.
+
+Uppgifterna byggs som dicts i routrarna och kodas här till färdiga bytes, så
+att resultatet kan cachas per variant och skickas utan response_model-
+validering. orjson och msgpack är valfria; saknas msgpack svarar API:t med
+JSON även om klienten ber om MessagePack.
+"""
+import json
+from datetime import date
+from typing import Iterable, Iterator, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+from . import schemas
+
+try:
+    import orjson
+except ImportError:  # orjson saknas: standardbibliotekets json används
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+# Fält som alltid ingår så att klienten kan para ihop uppgifter
+TASK_FIELDS = tuple(schemas.Task.model_fields)
+REQUIRED_TASK_FIELDS = ("id",)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[tuple[str, ...]]:
+    """`fields=id,status,title` -> fälten i schemats ordning. None betyder alla fält."""
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(TASK_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))} (allowed: {', '.join(TASK_FIELDS)})",
+        )
+    requested.update(REQUIRED_TASK_FIELDS)
+    return tuple(name for name in TASK_FIELDS if name in requested)
+
+
+def project(tasks: Iterable[dict], fields: Optional[tuple[str, ...]]) -> list:
+    if fields is None:
+        return list(tasks)
+    return [{name: task[name] for name in fields} for task in tasks]
+
+
+def _media_ranges(accept: str) -> dict[str, float]:
+    """`Accept` -> {mediaintervall: q}. Ogiltiga q räknas som 0."""
+    ranges: dict[str, float] = {}
+    for part in accept.split(","):
+        media_range, *params = part.split(";")
+        media_range = media_range.strip().lower()
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges[media_range] = max(q, ranges.get(media_range, 0.0))
+    return ranges
+
+
+def negotiate(request: Request) -> str:
+    """
+    MessagePack bara om klienten uttryckligen ber om det med q > 0 och inte
+    föredrar JSON; `application/msgpack;q=0` ger alltså JSON.
+    """
+    if msgpack is None:
+        return JSON_MEDIA_TYPE
+    ranges = _media_ranges(request.headers.get("accept", ""))
+    msgpack_q = max((ranges.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES), default=0.0)
+    if msgpack_q <= 0:
+        return JSON_MEDIA_TYPE
+    # Mest specifika intervallet gäller för JSON
+    json_q = next(
+        (ranges[media_range] for media_range in (JSON_MEDIA_TYPE, "application/*", "*/*") if media_range in ranges),
+        0.0,
+    )
+    return MSGPACK_MEDIA_TYPE if msgpack_q >= json_q else JSON_MEDIA_TYPE
+
+
+def cache_variant(media_type: str, fields: Optional[tuple[str, ...]]) -> str:
+    return f"{media_type};{','.join(fields) if fields else '*'}"
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def encode(payload, media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(payload, default=_default)
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encoded_response(body: bytes, media_type: str = JSON_MEDIA_TYPE) -> Response:
+    # Färdigkodat svar: FastAPI hoppar över response_model-valideringen
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+def encode_array_stream(items: Iterable, media_type: str, length: int) -> Iterator[bytes]:
+    """Kodar en lista element för element, för StreamingResponse."""
+    if media_type == MSGPACK_MEDIA_TYPE:
+        packer = msgpack.Packer(default=_default)
+        yield packer.pack_array_header(length)
+        for item in items:
+            yield packer.pack(item)
+        return
+
+    yield b"["
+    for index, item in enumerate(items):
+        if index:
+            yield b","
+        yield encode(item, media_type)
+    yield b"]"
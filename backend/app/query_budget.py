@@ -0,0 +1,92 @@
+"""
+Frågebudget per route: hur många SQL-satser en request högst får köra.
+
+Varje route deklarerar sin budget med `@budget(n)` direkt under route-
+dekoratorn. `record_queries()` spelar in alla satser som körs mot motorerna
+medan blocket är aktivt; scripts/check_query_budgets.py anropar varje route
+och avbryter med de inspelade satserna när en budget överskrids. Budgeten
+gäller värsta fallet: utan användarcache och utan dagsschema-cache. Skriv-
+vägar som loggar i schedule_changes räknar med ett lås till (changes.lock_units)
+som bara körs i Postgres; skriptet kör mot SQLite och ligger då en under.
+
+Routes som tar en lista av poster anger en fast del plus en kostnad per post,
+`@budget(n, per_item=k)`; gränsen blir n + k * antal poster i anropet.
+
+    @router.get("/units", response_model=List[schemas.Unit])
+    @budget(3)
+    def get_units(...):
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUDGET_ATTRIBUTE = "__query_budget__"
+BUDGET_PER_ITEM_ATTRIBUTE = "__query_budget_per_item__"
+
+
+def budget(max_queries: int, per_item: int = 0) -> Callable:
+    def decorate(endpoint: Callable) -> Callable:
+        setattr(endpoint, BUDGET_ATTRIBUTE, max_queries)
+        setattr(endpoint, BUDGET_PER_ITEM_ATTRIBUTE, per_item)
+        return endpoint
+    return decorate
+
+
+def get_budget(endpoint: Callable, items: int = 0) -> Optional[int]:
+    max_queries = getattr(endpoint, BUDGET_ATTRIBUTE, None)
+    if max_queries is None:
+        return None
+    return max_queries + getattr(endpoint, BUDGET_PER_ITEM_ATTRIBUTE, 0) * items
+
+
+@dataclass
+class RecordedQuery:
+    statement: str
+    parameters: Any
+    executemany: bool
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries: list[RecordedQuery] = []
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries.append(RecordedQuery(statement, parameters, executemany))
+
+    def format(self) -> str:
+        lines = []
+        for index, query in enumerate(self.queries, start=1):
+            statement = " ".join(query.statement.split())
+            suffix = " [executemany]" if query.executemany else ""
+            lines.append(f"  {index}. {statement}{suffix}")
+        return "\n".join(lines)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def record_queries(*engines: Engine) -> Iterator[QueryRecorder]:
+    """Spela in satser på alla motorer, oavsett tråd (TestClient kör appen i en annan tråd)."""
+    recorder = QueryRecorder()
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", recorder._on_execute)
+    try:
+        yield recorder
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", recorder._on_execute)
+
+
+def assert_within_budget(recorder: QueryRecorder, max_queries: int, label: str) -> None:
+    if len(recorder) > max_queries:
+        raise QueryBudgetExceeded(
+            f"{label}: {len(recorder)} queries, budget {max_queries}\n{recorder.format()}"
+        )
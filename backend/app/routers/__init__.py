@@ -5,9 +5,11 @@ API Routers - separated by concern
 from . import local_auth
 from . import oidc_auth
 from . import api as api_router
+from . import api_async as api_async_router
 
 __all__ = [
     "local_auth",
     "oidc_auth",
     "api_router",
+    "api_async_router",
 ]
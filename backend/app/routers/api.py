@@ -1,27 +1,125 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+import io
 import json
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import date
+from typing import List, Optional
+from datetime import date, timedelta
 import uuid
-from .. import models, schemas, db
-from ..auth import get_current_user_hybrid
+from .. import models, schemas, db, payload, changes, events
+from ..schedule_cache import day_schedule_cache
+from .. import task_import
+from ..query_budget import budget
+from ..auth import AuthenticatedUser, get_current_user_hybrid
 
 router = APIRouter(tags=["api"])
 
+# Längsta fönster som /schedule/range accepterar, och gränsen då svaret streamas
+# dag för dag i stället för att byggas som en lista i minnet.
+SCHEDULE_RANGE_MAX_DAYS = 366
+SCHEDULE_RANGE_STREAM_THRESHOLD_DAYS = 31
+
+# Max antal poster i en batch-signering
+TASK_INSTANCE_BATCH_MAX_ITEMS = 500
+
+# Max antal pass i en PUT /roster
+ROSTER_MAX_ITEMS = 500
+
+# Sortering i SQL på den typade tidskolumnen (mallar utan starttid sist)
+TEMPLATE_ORDER = (models.TaskTemplate.time_start.asc().nulls_last(), models.TaskTemplate.id)
+
+# Bara kolumnerna som schemasvaren behöver. Raderna har samma attributnamn som
+# modellen, så _build_task fungerar utan att ORM-objekt byggs.
+TEMPLATE_COLUMNS = (
+    models.TaskTemplate.id,
+    models.TaskTemplate.unit_id,
+    models.TaskTemplate.title,
+    models.TaskTemplate.description,
+    models.TaskTemplate.assignee_id,
+    models.TaskTemplate.substitute_instructions,
+    models.TaskTemplate.category,
+    models.TaskTemplate.role_type,
+    models.TaskTemplate.is_shared,
+    models.TaskTemplate.valid_on_date,
+    models.TaskTemplate.meta_data,
+)
+
+
+def _decode_meta(raw_meta) -> dict:
+    meta = raw_meta or {}
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except json.JSONDecodeError:
+            meta = {}
+    return meta
+
+
+def _build_task(template, meta: dict, status: str, report_data) -> dict:
+    # Samma fältordning som schemas.Task; svaret valideras inte om mot modellen
+    return {
+        "id": template.id,
+        "unitId": template.unit_id,
+        "title": template.title,
+        "description": template.description,
+        "assigneeId": template.assignee_id,
+        "substituteInstructions": template.substitute_instructions,
+        "category": template.category,
+        "status": status,
+        "roleType": template.role_type,
+        "isShared": template.is_shared,
+        "validOnDate": template.valid_on_date,
+        "meta": meta,
+        "reportData": report_data,
+    }
+
+
+def _day_rows_stmt(unit_ids: List[str], day: date, assignee_id: Optional[str] = None):
+    """
+    Mallar för dagen med dagens instans i samma fråga (LEFT JOIN). Det unika
+    indexet på (template_id, date) ger högst en instans per mall.
+    """
+    instance = models.TaskInstance
+    stmt = select(*TEMPLATE_COLUMNS, instance.status, instance.report_data).outerjoin(
+        instance,
+        (instance.template_id == models.TaskTemplate.id) & (instance.date == day),
+    ).where(
+        models.TaskTemplate.unit_id.in_(unit_ids),
+        (models.TaskTemplate.valid_on_date == None) | (models.TaskTemplate.valid_on_date == day),
+    )
+    if assignee_id is not None:
+        stmt = stmt.where(models.TaskTemplate.assignee_id == assignee_id)
+    return stmt.order_by(*TEMPLATE_ORDER)
 
-@router.get("/units", response_model=List[schemas.Unit])
-def get_units(
-    db_session: Session = Depends(db.get_db),
-    current_user: models.User = Depends(get_current_user_hybrid),
-):
+
+def _row_task(row) -> dict:
+    return _build_task(row, _decode_meta(row.meta_data), row.status or "pending", row.report_data)
+
+
+def _day_schedule_body(
+    day: date,
+    rows,
+    fields: Optional[tuple] = None,
+    media_type: str = payload.JSON_MEDIA_TYPE,
+) -> bytes:
+    tasks = payload.project((_row_task(row) for row in rows), fields)
+    return payload.encode({"date": day, "tasks": tasks}, media_type)
+
+
+def _permitted_units(db_session: Session, current_user: AuthenticatedUser) -> List[models.Unit]:
     # Admin: alla units
     if current_user.role == "admin":
         return db_session.query(models.Unit).all()
 
     # Admin: bara de units admin är kopplad till (inte alla)
     if current_user.role == "unit_admin":
-        return current_user.admin_units
+        if not current_user.admin_unit_ids:
+            return []
+        return db_session.query(models.Unit).filter(
+            models.Unit.id.in_(current_user.admin_unit_ids),
+        ).all()
 
     # Staff/User: bara sin unit
     if not current_user.unit_id:
@@ -30,10 +128,20 @@ def get_units(
     return db_session.query(models.Unit).filter(models.Unit.id == current_user.unit_id).all()
 
 
+@router.get("/units", response_model=List[schemas.Unit])
+@budget(3)
+def get_units(
+    db_session: Session = Depends(db.get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
+):
+    return _permitted_units(db_session, current_user)
+
+
 @router.get("/staff", response_model=List[schemas.User])
+@budget(3)
 def get_staff(
     db_session: Session = Depends(db.get_db),
-    current_user: models.User = Depends(get_current_user_hybrid),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
 ):
     staff_roles = ["staff", "admin", "unit_admin"]
 
@@ -41,7 +149,7 @@ def get_staff(
         return db_session.query(models.User).filter(models.User.role.in_(staff_roles)).all()
 
     if current_user.role == "unit_admin":
-        allowed_unit_ids = [unit.id for unit in current_user.admin_units]
+        allowed_unit_ids = list(current_user.admin_unit_ids)
         if not allowed_unit_ids:
             return []
         return db_session.query(models.User).filter(
@@ -58,15 +166,16 @@ def get_staff(
 
 
 @router.get("/users", response_model=List[schemas.User])
+@budget(3)
 def get_users(
     db_session: Session = Depends(db.get_db),
-    current_user: models.User = Depends(get_current_user_hybrid),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
 ):
     if current_user.role == "admin":
         return db_session.query(models.User).filter(models.User.role == "user").all()
 
     if current_user.role == "unit_admin":
-        allowed_unit_ids = [unit.id for unit in current_user.admin_units]
+        allowed_unit_ids = list(current_user.admin_unit_ids)
         if not allowed_unit_ids:
             return []
 
@@ -85,96 +194,563 @@ def get_users(
 
 
 @router.get("/schedule/day", response_model=schemas.DaySchedule)
+@budget(1)
 def get_day_schedule(
+    request: Request,
     date: date,
     unitId: str,
+    assigneeId: Optional[str] = None,
+    fields: Optional[str] = None,
     db_session: Session = Depends(db.get_db),
 ):
-    templates = db_session.query(models.TaskTemplate).filter(
-        models.TaskTemplate.unit_id == unitId,
-        (models.TaskTemplate.valid_on_date == None) | (models.TaskTemplate.valid_on_date == date),
-    ).all()
+    # Bara det ofiltrerade schemat cachas, färdigkodat per format och fälturval
+    task_fields = payload.parse_fields(fields)
+    media_type = payload.negotiate(request)
+    variant = payload.cache_variant(media_type, task_fields)
+    use_cache = assigneeId is None
+    if use_cache:
+        cached = day_schedule_cache.get(unitId, date, variant)
+        if cached is not None:
+            return payload.encoded_response(cached, media_type)
+    generation = day_schedule_cache.generation(unitId)
+
+    rows = db_session.execute(_day_rows_stmt([unitId], date, assigneeId)).all()
+    body = _day_schedule_body(date, rows, task_fields, media_type)
+    if use_cache:
+        day_schedule_cache.put(unitId, date, body, generation, variant)
+    return payload.encoded_response(body, media_type)
+
+
+@router.get("/schedule/changes", response_model=schemas.ScheduleChanges)
+@budget(1)
+def get_schedule_changes(
+    unitId: str,
+    since: Optional[int] = Query(None, ge=0),
+    db_session: Session = Depends(db.get_db),
+):
+    """
+    Ändringar av mallar och instanser för en enhet efter `since`, plus ny
+    cursor. Utan `since` returneras bara aktuell cursor (startvärde för
+    klienten). Vid `hasMore` hämtar klienten igen med den nya cursorn.
+    """
+    if since is None:
+        cursor = db_session.execute(changes.latest_seq_stmt(unitId)).scalar()
+        return {"cursor": cursor, "hasMore": False, "changes": []}
+
+    rows = db_session.execute(changes.changes_stmt(unitId, since)).all()
+    return changes.changes_body(rows, since)
+
+
+@router.get("/schedule/stream")
+@budget(2)
+async def stream_schedule(
+    unitId: str,
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
+):
+    """
+    Server-Sent Events med ändringar för en enhet (`change` och `resync`).
+    Efter anslutning och vid `resync` hämtar klienten ikapp via /schedule/changes.
+    Kräver samma behörighet till enheten som /roster.
+    """
+    if not _can_see_unit(current_user, unitId):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    if not events.broker.accepting():
+        raise HTTPException(status_code=503, detail="Too many event streams", headers={"Retry-After": "30"})
+    if not events.broker.accepting(current_user.id):
+        raise HTTPException(status_code=429, detail="Too many event streams for this user", headers={"Retry-After": "30"})
+    return StreamingResponse(
+        events.sse_stream(unitId, current_user.id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/schedule/cache-stats")
+@budget(0)
+def get_schedule_cache_stats():
+    return day_schedule_cache.stats()
 
-    instances = db_session.query(models.TaskInstance).filter(
-        models.TaskInstance.date == date,
+
+@router.get("/schedule/range", response_model=List[schemas.DaySchedule])
+@budget(2)
+def get_schedule_range(
+    request: Request,
+    unitId: str,
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    assigneeId: Optional[str] = None,
+    fields: Optional[str] = None,
+    db_session: Session = Depends(db.get_db),
+):
+    """
+    Schema för en enhet över flera dagar (t.ex. vecko- och tvåveckorsvyn).
+    Mallar och instanser hämtas en gång för hela fönstret i stället för
+    ett /schedule/day-anrop per dag. Stora fönster streamas dag för dag.
+    """
+    day_count = _range_day_count(from_date, to_date)
+    task_fields = payload.parse_fields(fields)
+
+    query = db_session.query(*TEMPLATE_COLUMNS).filter(
+        models.TaskTemplate.unit_id == unitId,
+        (models.TaskTemplate.valid_on_date == None)
+        | models.TaskTemplate.valid_on_date.between(from_date, to_date),
+    )
+    if assigneeId is not None:
+        query = query.filter(models.TaskTemplate.assignee_id == assigneeId)
+    templates = query.order_by(*TEMPLATE_ORDER).all()
+
+    instances = db_session.query(
+        models.TaskInstance.template_id,
+        models.TaskInstance.date,
+        models.TaskInstance.status,
+        models.TaskInstance.report_data,
+    ).filter(
+        models.TaskInstance.date.between(from_date, to_date),
         models.TaskInstance.template_id.in_([t.id for t in templates]),
     ).all()
 
-    instance_map = {i.template_id: i for i in instances}
-
-    tasks_data = []
-    for t in templates:
-        inst = instance_map.get(t.id)
-        status = inst.status if inst else "pending"
-
-        meta = t.meta_data or {}
-        if isinstance(meta, str):
-            try:
-                meta = json.loads(meta)
-            except json.JSONDecodeError:
-                meta = {}
-
-        tasks_data.append(
-            {
-                "id": t.id,
-                "unitId": t.unit_id,
-                "title": t.title,
-                "description": t.description,
-                "substituteInstructions": t.substitute_instructions,
-                "category": t.category,
-                "status": status,
-                "roleType": t.role_type,
-                "isShared": t.is_shared,
-                "validOnDate": t.valid_on_date,
-                "meta": meta,
-                "assigneeId": meta.get("assigneeId") if isinstance(meta, dict) else None,
-                "reportData": inst.report_data if inst else None,
-            }
+    return _range_response(templates, instances, from_date, day_count, task_fields, payload.negotiate(request))
+
+
+def _range_day_count(from_date: date, to_date: date) -> int:
+    if to_date < from_date:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    day_count = (to_date - from_date).days + 1
+    if day_count > SCHEDULE_RANGE_MAX_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range too large (max {SCHEDULE_RANGE_MAX_DAYS} days)",
         )
+    return day_count
+
+
+def _range_response(
+    templates,
+    instances,
+    from_date: date,
+    day_count: int,
+    fields: Optional[tuple] = None,
+    media_type: str = payload.JSON_MEDIA_TYPE,
+):
+    # Bara det som behövs per (mall, dag) sparas
+    instance_map = {(i.template_id, i.date): (i.status, i.report_data) for i in instances}
+    # meta_data avkodas en gång per mall, inte en gång per dag
+    decoded = [(t, _decode_meta(t.meta_data)) for t in templates]
+
+    def build_day(day: date) -> dict:
+        tasks_data = []
+        for t, meta in decoded:
+            if t.valid_on_date is not None and t.valid_on_date != day:
+                continue
+            status, report_data = instance_map.get((t.id, day), ("pending", None))
+            tasks_data.append(_build_task(t, meta, status, report_data))
+        return {"date": day, "tasks": payload.project(tasks_data, fields)}
+
+    days = (from_date + timedelta(days=offset) for offset in range(day_count))
+
+    if day_count <= SCHEDULE_RANGE_STREAM_THRESHOLD_DAYS:
+        return payload.encoded_response(payload.encode([build_day(day) for day in days], media_type), media_type)
+
+    return StreamingResponse(
+        payload.encode_array_stream((build_day(day) for day in days), media_type, day_count),
+        media_type=media_type,
+        headers={"Vary": "Accept"},
+    )
+
+
+@router.get("/schedule/overview", response_model=schemas.ScheduleOverview)
+@budget(4)
+def get_schedule_overview(
+    request: Request,
+    date: date,
+    unitIds: Optional[List[str]] = Query(None),
+    fields: Optional[str] = None,
+    db_session: Session = Depends(db.get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
+):
+    """
+    Dagsschema för alla enheter användaren får se (samma urval som /units),
+    i ett anrop. Antalet frågor är fast oavsett hur många enheter som ingår:
+    en för enheterna och en för mallar med dagens instanser, plus
+    autentiseringen (användaren, och admin_units för unit_admin). Värsta
+    fallet är alltså 4.
+    """
+    task_fields = payload.parse_fields(fields)
+    media_type = payload.negotiate(request)
+    units = _permitted_units(db_session, current_user)
+    if unitIds:
+        requested = set(unitIds)
+        units = [u for u in units if u.id in requested]
+    if not units:
+        return _overview_response(date, [], [], task_fields, media_type)
+
+    rows = db_session.execute(_day_rows_stmt([u.id for u in units], date)).all()
+    return _overview_response(date, units, rows, task_fields, media_type)
+
+
+def _overview_response(
+    date: date,
+    units,
+    rows,
+    fields: Optional[tuple] = None,
+    media_type: str = payload.JSON_MEDIA_TYPE,
+) -> Response:
+    tasks_by_unit: dict[str, list] = {u.id: [] for u in units}
+    for row in rows:
+        tasks_by_unit[row.unit_id].append(_row_task(row))
+
+    return payload.encoded_response(payload.encode({
+        "date": date,
+        "units": [
+            {"unitId": u.id, "unitName": u.name, "tasks": payload.project(tasks_by_unit[u.id], fields)}
+            for u in units
+        ],
+    }, media_type), media_type)
+
+
+@router.get("/schedule/mine", response_model=List[schemas.DaySchedule])
+@budget(4)
+def get_my_schedule(
+    request: Request,
+    date: Optional[date] = None,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    fields: Optional[str] = None,
+    db_session: Session = Depends(db.get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
+):
+    """
+    Den inloggades uppgifter för en dag (`date`) eller ett intervall
+    (`from`/`to`): mallar för användarens pass i bemanningen plus mallar som
+    är direkt tilldelade användaren (assigneeId). Två indexerade frågor
+    oavsett hur många pass enheten har.
+    """
+    from_date, to_date, day_count = _mine_window(date, from_date, to_date)
+    task_fields = payload.parse_fields(fields)
+
+    roster_rows = db_session.execute(_roster_rows_stmt(current_user.id, from_date, to_date)).all()
+    assigned_rows = db_session.execute(_assigned_rows_stmt(current_user.id, from_date, to_date)).all()
+    return _mine_response(
+        roster_rows, assigned_rows, from_date, day_count, task_fields, payload.negotiate(request),
+    )
+
+
+def _mine_window(day: Optional[date], from_date: Optional[date], to_date: Optional[date]) -> tuple:
+    if day is not None:
+        from_date = to_date = day
+    if from_date is None or to_date is None:
+        raise HTTPException(status_code=400, detail="Give either 'date' or both 'from' and 'to'")
+    return from_date, to_date, _range_day_count(from_date, to_date)
+
+
+def _roster_rows_stmt(user_id: str, from_date: date, to_date: date):
+    """
+    Mallar för användarens pass med passets dag och instans. Drivs av
+    indexen på roster_entries (user_id, date) och task_templates (unit_id, role_type).
+    """
+    roster = models.RosterEntry
+    template = models.TaskTemplate
+    instance = models.TaskInstance
+    return select(
+        *TEMPLATE_COLUMNS, template.time_start, roster.date.label("day"), instance.status, instance.report_data,
+    ).select_from(roster).join(
+        template,
+        (template.unit_id == roster.unit_id)
+        & (template.role_type == roster.role_type)
+        & ((template.valid_on_date == None) | (template.valid_on_date == roster.date)),
+    ).outerjoin(
+        instance,
+        (instance.template_id == template.id) & (instance.date == roster.date),
+    ).where(
+        roster.user_id == user_id,
+        roster.date.between(from_date, to_date),
+    )
+
+
+def _assigned_rows_stmt(user_id: str, from_date: date, to_date: date):
+    # En rad per mall och instans i fönstret (day är None om mallen saknar instanser)
+    template = models.TaskTemplate
+    instance = models.TaskInstance
+    return select(
+        *TEMPLATE_COLUMNS, template.time_start, instance.date.label("day"), instance.status, instance.report_data,
+    ).outerjoin(
+        instance,
+        (instance.template_id == template.id) & instance.date.between(from_date, to_date),
+    ).where(
+        template.assignee_id == user_id,
+        (template.valid_on_date == None) | template.valid_on_date.between(from_date, to_date),
+    )
+
 
-    return {"date": date, "tasks": tasks_data}
+def _mine_sort_key(row) -> tuple:
+    # Samma ordning som TEMPLATE_ORDER: starttid, mallar utan starttid sist
+    return (row.time_start is None, row.time_start or "", row.id)
+
+
+def _mine_response(
+    roster_rows,
+    assigned_rows,
+    from_date: date,
+    day_count: int,
+    fields: Optional[tuple] = None,
+    media_type: str = payload.JSON_MEDIA_TYPE,
+) -> Response:
+    days = [from_date + timedelta(days=offset) for offset in range(day_count)]
+    tasks_by_day: dict[date, dict] = {day: {} for day in days}
+    for row in roster_rows:
+        tasks_by_day[row.day][row.id] = (_mine_sort_key(row), _row_task(row))
+
+    assigned: dict[str, tuple] = {}
+    for row in assigned_rows:
+        _, instances = assigned.setdefault(row.id, (row, {}))
+        if row.day is not None:
+            instances[row.day] = (row.status, row.report_data)
+
+    # Tilldelade mallar gäller alla dagar i fönstret, även utan pass
+    for row, instances in assigned.values():
+        meta = _decode_meta(row.meta_data)
+        for day in days:
+            if (row.valid_on_date is not None and row.valid_on_date != day) or row.id in tasks_by_day[day]:
+                continue
+            status, report_data = instances.get(day, (None, None))
+            tasks_by_day[day][row.id] = (_mine_sort_key(row), _build_task(row, meta, status or "pending", report_data))
+
+    return payload.encoded_response(payload.encode([
+        {
+            "date": day,
+            "tasks": payload.project(
+                [task for _, task in sorted(tasks_by_day[day].values(), key=lambda item: item[0])], fields,
+            ),
+        }
+        for day in days
+    ], media_type), media_type)
+
+
+def _can_see_unit(current_user: AuthenticatedUser, unit_id: str) -> bool:
+    # Samma urval som _permitted_units, utan databasfråga
+    if current_user.role == "admin":
+        return True
+    if current_user.role == "unit_admin":
+        return unit_id in current_user.admin_unit_ids
+    return unit_id == current_user.unit_id
+
+
+@router.get("/roster", response_model=List[schemas.RosterEntry])
+@budget(3)
+def get_roster(
+    unitId: str,
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    db_session: Session = Depends(db.get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
+):
+    _range_day_count(from_date, to_date)
+    if not _can_see_unit(current_user, unitId):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return db_session.query(models.RosterEntry).filter(
+        models.RosterEntry.unit_id == unitId,
+        models.RosterEntry.date.between(from_date, to_date),
+    ).order_by(models.RosterEntry.date, models.RosterEntry.role_type).all()
+
+
+@router.put("/roster")
+@budget(4)
+def update_roster(
+    entries: List[schemas.RosterEntry],
+    db_session: Session = Depends(db.get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
+):
+    """
+    Sätt vem som har ett pass (unit_id, date, role_type). `user_id: null`
+    tar bort passet. Bara admin och unit_admin för enheten. Förekommer samma
+    pass flera gånger i anropet gäller den sista posten.
+    """
+    if len(entries) > ROSTER_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items (max {ROSTER_MAX_ITEMS})")
+    if current_user.role not in ("admin", "unit_admin") or not all(
+        _can_see_unit(current_user, entry.unit_id) for entry in entries
+    ):
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    # Postgres ON CONFLICT kan inte uppdatera samma rad två gånger i en sats
+    latest = {(entry.unit_id, entry.date, entry.role_type): entry for entry in entries}
+    assigned = [entry.model_dump() for entry in latest.values() if entry.user_id is not None]
+    removed = [entry for entry in latest.values() if entry.user_id is None]
+    if assigned:
+        db_session.execute(_roster_upsert(db_session.get_bind().dialect.name), assigned)
+    if removed:
+        roster = models.RosterEntry
+        db_session.execute(delete(roster).where(or_(*(
+            and_(roster.unit_id == entry.unit_id, roster.date == entry.date, roster.role_type == entry.role_type)
+            for entry in removed
+        ))))
+    db_session.commit()
+    return {"status": "success", "assigned": len(assigned), "removed": len(removed)}
+
+
+def _roster_upsert(dialect_name: str):
+    # executemany med ON CONFLICT på det unika indexet (unit_id, date, role_type)
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(models.RosterEntry.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=["unit_id", "date", "role_type"],
+        set_={"user_id": stmt.excluded.user_id},
+    )
+
+
+def _task_instance_upsert(dialect_name: str, template_id: str, update: schemas.TaskInstanceUpdate):
+    """
+    INSERT ... ON CONFLICT (template_id, date) DO UPDATE i en enda sats.
+    Två samtidiga signeringar av samma uppgift kan därmed inte skapa dubbletter.
+    Returnerar den lagrade raden (status, signed_by, signed_at, report_data).
+    """
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(models.TaskInstance.__table__).values(
+        template_id=template_id,
+        date=update.date,
+        status=update.status,
+        signed_by=update.signed_by,
+        signed_at=update.signed_at,
+        report_data=update.report_data,
+    )
+    changes = {
+        "status": stmt.excluded.status,
+        "signed_by": stmt.excluded.signed_by,
+        "signed_at": stmt.excluded.signed_at,
+    }
+    # Befintlig rapport skrivs bara över om en ny skickas med
+    if update.report_data is not None:
+        changes["report_data"] = stmt.excluded.report_data
+    table = models.TaskInstance.__table__
+    return stmt.on_conflict_do_update(index_elements=["template_id", "date"], set_=changes).returning(
+        table.c.status, table.c.signed_by, table.c.signed_at, table.c.report_data,
+    )
 
 
 @router.patch("/task-instances/{template_id}")
+@budget(3)
 def update_task_status(
     template_id: str,
     update: schemas.TaskInstanceUpdate,
     db_session: Session = Depends(db.get_db),
 ):
-    instance = db_session.query(models.TaskInstance).filter(
-        models.TaskInstance.template_id == template_id,
-        models.TaskInstance.date == update.date,
-    ).first()
-
-    if instance:
-        instance.status = update.status
-        instance.signed_by = update.signed_by
-        instance.signed_at = update.signed_at
-        if update.report_data is not None:
-            instance.report_data = update.report_data
-    else:
-        instance = models.TaskInstance(
-            template_id=template_id,
-            date=update.date,
-            status=update.status,
-            signed_by=update.signed_by,
-            signed_at=update.signed_at,
-            report_data=update.report_data,
-        )
-        db_session.add(instance)
-
+    dialect_name = db_session.get_bind().dialect.name
+    instance = db_session.execute(_task_instance_upsert(dialect_name, template_id, update)).one()
+    _execute_lock(db_session, changes.lock_template_unit(dialect_name, template_id))
+    logged = db_session.execute(changes.log_instance_change(template_id, update.date)).first()
     db_session.commit()
+
+    if logged:
+        day_schedule_cache.invalidate(logged.unit_id, update.date)
+        events.publish(logged.unit_id, events.instance_event(logged.seq, template_id, update.date, instance))
     return {"status": "success"}
 
 
-@router.post("/tasks")
-def create_task(
-    task: schemas.TaskCreate,
+@router.patch("/task-instances", response_model=List[schemas.TaskInstanceBatchResult])
+# Mallar + lås + ändringslogg, och savepoint/upsert/release per post
+@budget(3, per_item=3)
+def update_task_statuses(
+    updates: List[schemas.TaskInstanceBatchItem],
     db_session: Session = Depends(db.get_db),
 ):
-    new_id = str(uuid.uuid4())
-    db_task = models.TaskTemplate(
-        id=new_id,
+    """
+    Uppdatera flera uppgiftsinstanser i en transaktion (en commit).
+    Varje post körs i en egen savepoint så att ett fel bara påverkar den posten.
+    """
+    if len(updates) > TASK_INSTANCE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items (max {TASK_INSTANCE_BATCH_MAX_ITEMS})",
+        )
+
+    template_units = dict(
+        db_session.query(models.TaskTemplate.id, models.TaskTemplate.unit_id).filter(
+            models.TaskTemplate.id.in_({u.template_id for u in updates}),
+        ).all()
+    )
+
+    dialect_name = db_session.get_bind().dialect.name
+    results = []
+    affected = set()
+    logged = []
+    published = []
+    for update in updates:
+        result = {"template_id": update.template_id, "date": update.date}
+        if update.template_id not in template_units:
+            results.append({**result, "status": "not_found", "detail": "Task not found"})
+            continue
+        try:
+            with db_session.begin_nested():
+                instance = db_session.execute(_task_instance_upsert(dialect_name, update.template_id, update)).one()
+        except SQLAlchemyError as exc:
+            results.append({**result, "status": "error", "detail": exc.__class__.__name__})
+            continue
+        results.append({**result, "status": "success"})
+        affected.add((template_units[update.template_id], update.date))
+        logged.append(changes.change_row(
+            template_units[update.template_id], changes.KIND_INSTANCE, changes.OP_UPSERT,
+            update.template_id, update.date,
+        ))
+        published.append((update, instance))
+
+    logged_rows = []
+    if logged:
+        _execute_lock(db_session, changes.lock_units(dialect_name, [row["unit_id"] for row in logged]))
+        logged_rows = db_session.execute(changes.insert_changes(returning_seq=True), logged).all()
+    db_session.commit()
+
+    for unit_id, day in affected:
+        if unit_id:
+            day_schedule_cache.invalidate(unit_id, day)
+    _publish_instance_events(template_units, published, logged_rows)
+    return results
+
+
+def _publish_instance_events(template_units: dict, published: list, logged_rows) -> None:
+    # Som i /schedule/changes: en händelse per instans, med senaste läge och seq
+    seqs = {}
+    for row in logged_rows:
+        key = (row.template_id, row.date)
+        seqs[key] = max(row.seq, seqs.get(key, 0))
+    latest = {(update.template_id, update.date): (update, instance) for update, instance in published}
+    for key, (update, instance) in latest.items():
+        events.publish(
+            template_units[update.template_id],
+            events.instance_event(seqs[key], update.template_id, update.date, instance),
+        )
+
+
+def _execute_lock(db_session: Session, lock) -> None:
+    # Lås för ändringsloggen (changes.lock_units); None utanför Postgres
+    if lock is not None:
+        db_session.execute(lock)
+
+
+def _invalidate_template(unit_id: Optional[str], valid_on_date: Optional[date]) -> None:
+    # En mall med valid_on_date syns bara den dagen; annars påverkas alla dagar för enheten
+    if not unit_id:
+        return
+    if valid_on_date is not None:
+        day_schedule_cache.invalidate(unit_id, valid_on_date)
+    else:
+        day_schedule_cache.invalidate_unit(unit_id)
+
+
+def _template_change(unit_id: Optional[str], template_id: str, valid_on_date: Optional[date], op: str):
+    return models.ScheduleChange(**changes.change_row(unit_id, changes.KIND_TEMPLATE, op, template_id, valid_on_date))
+
+
+def _new_template(task: schemas.TaskCreate) -> models.TaskTemplate:
+    return models.TaskTemplate(
+        id=str(uuid.uuid4()),
         unit_id=task.unit_id,
         title=task.title,
         description=task.description,
@@ -185,13 +761,51 @@ def create_task(
         valid_on_date=task.valid_on_date,
         meta_data=task.meta_data,
     )
-    db_session.add(db_task)
+
+
+@router.post("/tasks")
+@budget(4)
+def create_task(
+    task: schemas.TaskCreate,
+    db_session: Session = Depends(db.get_db),
+):
+    db_task = _new_template(task)
+    new_id = db_task.id
+    change = _template_change(task.unit_id, new_id, task.valid_on_date, changes.OP_UPSERT)
+    _execute_lock(db_session, changes.lock_units(db_session.get_bind().dialect.name, [task.unit_id]))
+    db_session.add_all([db_task, change])
+    # seq tilldelas vid flush och läses innan commit hinner expirera objektet
+    db_session.flush()
+    seq = change.seq
     db_session.commit()
     db_session.refresh(db_task)
+    _invalidate_template(task.unit_id, task.valid_on_date)
+    events.publish(task.unit_id, events.template_event(seq, new_id, task.valid_on_date, changes.OP_UPSERT))
     return {"status": "success", "id": new_id}
 
 
+@router.post("/tasks/import", response_model=schemas.TaskImportResult)
+@budget(4)
+def import_tasks(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db_session: Session = Depends(db.get_db),
+):
+    """
+    Massimport av uppgiftsmallar (CSV eller NDJSON med TaskCreate-fält).
+    Ogiltiga rader listas i svaret; övriga rader importeras ändå.
+    """
+    fmt = format or task_import.detect_format(file.filename, file.content_type)
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    result = task_import.import_tasks(db_session.connection(), task_import.iter_rows(stream, fmt))
+    db_session.commit()
+    for unit_id in result.pop("affected_units"):
+        day_schedule_cache.invalidate_unit(unit_id)
+    return result
+
+
 @router.delete("/tasks/{task_id}")
+@budget(5)
 def delete_task(
     task_id: str,
     db_session: Session = Depends(db.get_db),
@@ -202,6 +816,14 @@ def delete_task(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
+    unit_id, valid_on_date = task.unit_id, task.valid_on_date
+    _execute_lock(db_session, changes.lock_units(db_session.get_bind().dialect.name, [unit_id]))
     db_session.delete(task)
+    change = _template_change(unit_id, task_id, valid_on_date, changes.OP_DELETE)
+    db_session.add(change)
+    db_session.flush()
+    seq = change.seq
     db_session.commit()
+    _invalidate_template(unit_id, valid_on_date)
+    events.publish(unit_id, events.template_event(seq, task_id, valid_on_date, changes.OP_DELETE))
     return {"status": "success"}
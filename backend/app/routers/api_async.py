@@ -0,0 +1,357 @@
+"""
+Asynkrona varianter av de mest anropade routerna i api.py (DB_ASYNC=true).
+
+Handlers här är `async def` mot en AsyncSession (aiosqlite/asyncpg), så en
+långsam databasfråga binder inte en tråd i trådpoolen. Routern registreras
+före den synkrona i main.py; routes som inte finns här (t.ex. /tasks/import)
+hanteras fortfarande av api.py. Svarsformat och cache-invalidering delas
+med api.py via dess hjälpfunktioner.
+"""
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import changes, db, events, models, payload, schemas
+from ..auth import AuthenticatedUser, get_current_user_hybrid_async
+from ..query_budget import budget
+from ..schedule_cache import day_schedule_cache
+from .api import (
+    TASK_INSTANCE_BATCH_MAX_ITEMS,
+    TEMPLATE_COLUMNS,
+    TEMPLATE_ORDER,
+    _day_rows_stmt,
+    _day_schedule_body,
+    _assigned_rows_stmt,
+    _invalidate_template,
+    _mine_response,
+    _mine_window,
+    _new_template,
+    _overview_response,
+    _publish_instance_events,
+    _template_change,
+    _range_day_count,
+    _range_response,
+    _roster_rows_stmt,
+    _task_instance_upsert,
+)
+
+router = APIRouter(tags=["api"])
+
+STAFF_ROLES = ["staff", "admin", "unit_admin"]
+
+
+async def _all(db_session: AsyncSession, stmt) -> list:
+    return list((await db_session.scalars(stmt)).all())
+
+
+def _dialect_name(db_session: AsyncSession) -> str:
+    return db_session.get_bind().dialect.name
+
+
+async def _execute_lock(db_session: AsyncSession, lock) -> None:
+    # Lås för ändringsloggen (changes.lock_units); None utanför Postgres
+    if lock is not None:
+        await db_session.execute(lock)
+
+
+async def _permitted_units(db_session: AsyncSession, current_user: AuthenticatedUser) -> List[models.Unit]:
+    stmt = select(models.Unit)
+    if current_user.role == "admin":
+        return await _all(db_session, stmt)
+
+    if current_user.role == "unit_admin":
+        if not current_user.admin_unit_ids:
+            return []
+        return await _all(db_session, stmt.where(models.Unit.id.in_(current_user.admin_unit_ids)))
+
+    if not current_user.unit_id:
+        return []
+    return await _all(db_session, stmt.where(models.Unit.id == current_user.unit_id))
+
+
+async def _users_in_scope(db_session: AsyncSession, current_user: AuthenticatedUser, role_filter) -> list:
+    # Samma urval som /staff och /users i api.py
+    stmt = select(models.User).where(role_filter)
+    if current_user.role == "admin":
+        return await _all(db_session, stmt)
+
+    if current_user.role == "unit_admin":
+        if not current_user.admin_unit_ids:
+            return []
+        return await _all(db_session, stmt.where(models.User.unit_id.in_(current_user.admin_unit_ids)))
+
+    if not current_user.unit_id:
+        return []
+    return await _all(db_session, stmt.where(models.User.unit_id == current_user.unit_id))
+
+
+@router.get("/units", response_model=List[schemas.Unit])
+@budget(3)
+async def get_units(
+    db_session: AsyncSession = Depends(db.get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid_async),
+):
+    return await _permitted_units(db_session, current_user)
+
+
+@router.get("/staff", response_model=List[schemas.User])
+@budget(3)
+async def get_staff(
+    db_session: AsyncSession = Depends(db.get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid_async),
+):
+    return await _users_in_scope(db_session, current_user, models.User.role.in_(STAFF_ROLES))
+
+
+@router.get("/users", response_model=List[schemas.User])
+@budget(3)
+async def get_users(
+    db_session: AsyncSession = Depends(db.get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid_async),
+):
+    return await _users_in_scope(db_session, current_user, models.User.role == "user")
+
+
+@router.get("/schedule/day", response_model=schemas.DaySchedule)
+@budget(1)
+async def get_day_schedule(
+    request: Request,
+    date: date,
+    unitId: str,
+    assigneeId: Optional[str] = None,
+    fields: Optional[str] = None,
+    db_session: AsyncSession = Depends(db.get_async_db),
+):
+    task_fields = payload.parse_fields(fields)
+    media_type = payload.negotiate(request)
+    variant = payload.cache_variant(media_type, task_fields)
+    use_cache = assigneeId is None
+    if use_cache:
+        cached = day_schedule_cache.get(unitId, date, variant)
+        if cached is not None:
+            return payload.encoded_response(cached, media_type)
+    generation = day_schedule_cache.generation(unitId)
+
+    result = await db_session.execute(_day_rows_stmt([unitId], date, assigneeId))
+    body = _day_schedule_body(date, result.all(), task_fields, media_type)
+    if use_cache:
+        day_schedule_cache.put(unitId, date, body, generation, variant)
+    return payload.encoded_response(body, media_type)
+
+
+@router.get("/schedule/changes", response_model=schemas.ScheduleChanges)
+@budget(1)
+async def get_schedule_changes(
+    unitId: str,
+    since: Optional[int] = Query(None, ge=0),
+    db_session: AsyncSession = Depends(db.get_async_db),
+):
+    if since is None:
+        cursor = await db_session.scalar(changes.latest_seq_stmt(unitId))
+        return {"cursor": cursor, "hasMore": False, "changes": []}
+
+    result = await db_session.execute(changes.changes_stmt(unitId, since))
+    return changes.changes_body(result.all(), since)
+
+
+@router.get("/schedule/range", response_model=List[schemas.DaySchedule])
+@budget(2)
+async def get_schedule_range(
+    request: Request,
+    unitId: str,
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    assigneeId: Optional[str] = None,
+    fields: Optional[str] = None,
+    db_session: AsyncSession = Depends(db.get_async_db),
+):
+    day_count = _range_day_count(from_date, to_date)
+    task_fields = payload.parse_fields(fields)
+
+    stmt = select(*TEMPLATE_COLUMNS).where(
+        models.TaskTemplate.unit_id == unitId,
+        (models.TaskTemplate.valid_on_date == None)
+        | models.TaskTemplate.valid_on_date.between(from_date, to_date),
+    )
+    if assigneeId is not None:
+        stmt = stmt.where(models.TaskTemplate.assignee_id == assigneeId)
+    templates = (await db_session.execute(stmt.order_by(*TEMPLATE_ORDER))).all()
+
+    result = await db_session.execute(select(
+        models.TaskInstance.template_id,
+        models.TaskInstance.date,
+        models.TaskInstance.status,
+        models.TaskInstance.report_data,
+    ).where(
+        models.TaskInstance.date.between(from_date, to_date),
+        models.TaskInstance.template_id.in_([t.id for t in templates]),
+    ))
+
+    return _range_response(
+        templates, result.all(), from_date, day_count, task_fields, payload.negotiate(request),
+    )
+
+
+@router.get("/schedule/overview", response_model=schemas.ScheduleOverview)
+@budget(4)
+async def get_schedule_overview(
+    request: Request,
+    date: date,
+    unitIds: Optional[List[str]] = Query(None),
+    fields: Optional[str] = None,
+    db_session: AsyncSession = Depends(db.get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid_async),
+):
+    task_fields = payload.parse_fields(fields)
+    media_type = payload.negotiate(request)
+    units = await _permitted_units(db_session, current_user)
+    if unitIds:
+        requested = set(unitIds)
+        units = [u for u in units if u.id in requested]
+    if not units:
+        return _overview_response(date, [], [], task_fields, media_type)
+
+    result = await db_session.execute(_day_rows_stmt([u.id for u in units], date))
+    return _overview_response(date, units, result.all(), task_fields, media_type)
+
+
+@router.get("/schedule/mine", response_model=List[schemas.DaySchedule])
+@budget(4)
+async def get_my_schedule(
+    request: Request,
+    date: Optional[date] = None,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    fields: Optional[str] = None,
+    db_session: AsyncSession = Depends(db.get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid_async),
+):
+    from_date, to_date, day_count = _mine_window(date, from_date, to_date)
+    task_fields = payload.parse_fields(fields)
+
+    roster_rows = (await db_session.execute(_roster_rows_stmt(current_user.id, from_date, to_date))).all()
+    assigned_rows = (await db_session.execute(_assigned_rows_stmt(current_user.id, from_date, to_date))).all()
+    return _mine_response(
+        roster_rows, assigned_rows, from_date, day_count, task_fields, payload.negotiate(request),
+    )
+
+
+@router.patch("/task-instances/{template_id}")
+@budget(3)
+async def update_task_status(
+    template_id: str,
+    update: schemas.TaskInstanceUpdate,
+    db_session: AsyncSession = Depends(db.get_async_db),
+):
+    dialect_name = _dialect_name(db_session)
+    instance = (await db_session.execute(_task_instance_upsert(dialect_name, template_id, update))).one()
+    await _execute_lock(db_session, changes.lock_template_unit(dialect_name, template_id))
+    logged = (await db_session.execute(changes.log_instance_change(template_id, update.date))).first()
+    await db_session.commit()
+
+    if logged:
+        day_schedule_cache.invalidate(logged.unit_id, update.date)
+        events.publish(logged.unit_id, events.instance_event(logged.seq, template_id, update.date, instance))
+    return {"status": "success"}
+
+
+@router.patch("/task-instances", response_model=List[schemas.TaskInstanceBatchResult])
+# Mallar + lås + ändringslogg, och savepoint/upsert/release per post
+@budget(3, per_item=3)
+async def update_task_statuses(
+    updates: List[schemas.TaskInstanceBatchItem],
+    db_session: AsyncSession = Depends(db.get_async_db),
+):
+    if len(updates) > TASK_INSTANCE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items (max {TASK_INSTANCE_BATCH_MAX_ITEMS})",
+        )
+
+    rows = await db_session.execute(
+        select(models.TaskTemplate.id, models.TaskTemplate.unit_id).where(
+            models.TaskTemplate.id.in_({u.template_id for u in updates}),
+        )
+    )
+    template_units = dict(rows.all())
+
+    dialect_name = _dialect_name(db_session)
+    results = []
+    affected = set()
+    logged = []
+    published = []
+    for update in updates:
+        result = {"template_id": update.template_id, "date": update.date}
+        if update.template_id not in template_units:
+            results.append({**result, "status": "not_found", "detail": "Task not found"})
+            continue
+        try:
+            async with db_session.begin_nested():
+                instance = (await db_session.execute(
+                    _task_instance_upsert(dialect_name, update.template_id, update)
+                )).one()
+        except SQLAlchemyError as exc:
+            results.append({**result, "status": "error", "detail": exc.__class__.__name__})
+            continue
+        results.append({**result, "status": "success"})
+        affected.add((template_units[update.template_id], update.date))
+        logged.append(changes.change_row(
+            template_units[update.template_id], changes.KIND_INSTANCE, changes.OP_UPSERT,
+            update.template_id, update.date,
+        ))
+        published.append((update, instance))
+
+    logged_rows = []
+    if logged:
+        await _execute_lock(db_session, changes.lock_units(dialect_name, [row["unit_id"] for row in logged]))
+        logged_rows = (await db_session.execute(changes.insert_changes(returning_seq=True), logged)).all()
+    await db_session.commit()
+
+    for unit_id, day in affected:
+        if unit_id:
+            day_schedule_cache.invalidate(unit_id, day)
+    _publish_instance_events(template_units, published, logged_rows)
+    return results
+
+
+@router.post("/tasks")
+@budget(3)
+async def create_task(
+    task: schemas.TaskCreate,
+    db_session: AsyncSession = Depends(db.get_async_db),
+):
+    db_task = _new_template(task)
+    change = _template_change(task.unit_id, db_task.id, task.valid_on_date, changes.OP_UPSERT)
+    await _execute_lock(db_session, changes.lock_units(_dialect_name(db_session), [task.unit_id]))
+    db_session.add_all([db_task, change])
+    await db_session.commit()
+    _invalidate_template(task.unit_id, task.valid_on_date)
+    events.publish(task.unit_id, events.template_event(change.seq, db_task.id, task.valid_on_date, changes.OP_UPSERT))
+    return {"status": "success", "id": db_task.id}
+
+
+@router.delete("/tasks/{task_id}")
+@budget(5)
+async def delete_task(
+    task_id: str,
+    db_session: AsyncSession = Depends(db.get_async_db),
+):
+    await db_session.execute(delete(models.TaskInstance).where(models.TaskInstance.template_id == task_id))
+
+    task = await db_session.get(models.TaskTemplate, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    unit_id, valid_on_date = task.unit_id, task.valid_on_date
+    await _execute_lock(db_session, changes.lock_units(_dialect_name(db_session), [unit_id]))
+    await db_session.delete(task)
+    change = _template_change(unit_id, task_id, valid_on_date, changes.OP_DELETE)
+    db_session.add(change)
+    await db_session.commit()
+    _invalidate_template(unit_id, valid_on_date)
+    events.publish(unit_id, events.template_event(change.seq, task_id, valid_on_date, changes.OP_DELETE))
+    return {"status": "success"}
@@ -1,28 +1,107 @@
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from .. import models, schemas, db
-from ..auth import local_jwt
+from ..auth import AuthenticatedUser, get_current_user_hybrid, local_jwt, refresh_tokens
+from ..auth.password_pool import PasswordPoolSaturated, password_hash_pool
+from ..query_budget import budget
 
 router = APIRouter(tags=["local-auth"])
 
 
 @router.post("/token", response_model=schemas.Token)
+@budget(2)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db_session: Session = Depends(db.get_db),
 ):
-    user = db_session.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not local_jwt.verify_password(form_data.password, user.hashed_password):
+    # Sessionen är synkron: frågor och commit körs i trådpoolen, inte på event-loopen
+    user = await run_in_threadpool(_find_user, db_session, form_data.username)
+    password_ok = False
+    new_hash = None
+    if user:
+        # Hashningen körs i en begränsad pool, inte på event-loopen
+        try:
+            password_ok, new_hash = await password_hash_pool.verify_and_update(
+                form_data.password, user.hashed_password
+            )
+        except PasswordPoolSaturated:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Login temporarily overloaded, try again",
+                headers={"Retry-After": "1"},
+            )
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token = local_jwt.create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = await run_in_threadpool(_complete_login, db_session, user, new_hash)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+def _find_user(db_session: Session, username: str) -> Optional[models.User]:
+    return db_session.query(models.User).filter(models.User.username == username).first()
+
+
+def _complete_login(db_session: Session, user: models.User, new_hash: Optional[str]) -> str:
+    if new_hash:
+        # Migrera lagrad hash till aktuellt schema/rundor
+        user.hashed_password = new_hash
+    refresh_token, _grant = refresh_tokens.issue_refresh_token(db_session, user.id)
+    db_session.commit()
+    return refresh_token
+
+
+@router.post("/token/refresh", response_model=schemas.Token)
+@budget(5)
+def refresh_access_token(
+    body: schemas.RefreshRequest,
+    db_session: Session = Depends(db.get_db),
+):
+    # Nytt access-token utan lösenordskontroll; refresh-token roteras
+    user, refresh_token = refresh_tokens.rotate_refresh_token(db_session, body.refresh_token)
+    access_token = local_jwt.create_access_token(data={"sub": user.username})
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@router.post("/token/revoke")
+@budget(2)
+def revoke_refresh_token(
+    body: schemas.RefreshRequest,
+    db_session: Session = Depends(db.get_db),
+):
+    # Utloggning: återkalla hela familjen som token tillhör
+    grant = db_session.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == refresh_tokens.hash_refresh_token(body.refresh_token),
+    ).first()
+    if grant:
+        refresh_tokens.revoke_family(db_session, grant.family_id)
+        db_session.commit()
+    return {"status": "success"}
+
+
+@router.post("/token/revoke-all")
+@budget(2)
+def revoke_all_refresh_tokens(
+    userId: Optional[str] = None,
+    db_session: Session = Depends(db.get_db),
+    current_user: AuthenticatedUser = Depends(get_current_user_hybrid),
+):
+    # Egna grants, eller en annan användares om man är admin
+    target_user_id = userId or current_user.id
+    if target_user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
+    revoked = refresh_tokens.revoke_user_tokens(db_session, target_user_id)
+    db_session.commit()
+    return {"status": "success", "revoked": revoked}
 
 
 @router.get("/me", response_model=schemas.User)
+@budget(1)
 def get_me(current_user: models.User = Depends(local_jwt.get_current_user)):
     return current_user
@@ -3,6 +3,7 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from .. import models, db
 from ..auth import oidc
+from ..query_budget import budget
 
 router = APIRouter(prefix="/oidc", tags=["oidc-auth"])
 oidc_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -30,6 +31,7 @@ def get_current_user_oidc(
 
 
 @router.get("/me")
+@budget(3)
 def me_oidc(
     current_user: models.User = Depends(get_current_user_oidc),
     _claims: dict = Depends(require_oidc_access),
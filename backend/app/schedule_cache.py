@@ -0,0 +1,119 @@
+"""
+In-process cache för beräknade dagsscheman (/schedule/day), som färdigkodade bytes.
+
+Nyckeln är (unit_id, date). Under varje nyckel ligger en variant per
+svarsformat och fälturval (payload.cache_variant), högst
+SCHEDULE_CACHE_MAX_VARIANTS stycken. Cachen är LRU-begränsad och invalideras
+explicit av skrivvägarna i routers/api.py.
+
+Varje worker-process har sin egen cache och invalideringen når bara den
+process som skrev. Därför har varje variant också en livstid
+(SCHEDULE_CACHE_TTL_SECONDS), som begränsar hur länge andra workers kan
+servera ett gammalt schema. På Vercel är cachen avstängd som standard.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Optional
+
+SCHEDULE_CACHE_MAX_ENTRIES = int(os.getenv("SCHEDULE_CACHE_MAX_ENTRIES", "0" if os.getenv("VERCEL") else "512"))
+SCHEDULE_CACHE_MAX_VARIANTS = int(os.getenv("SCHEDULE_CACHE_MAX_VARIANTS", "8"))
+# 0 = ingen livstid (bara säkert med en enda worker-process)
+SCHEDULE_CACHE_TTL_SECONDS = float(os.getenv("SCHEDULE_CACHE_TTL_SECONDS", "10"))
+
+
+class DayScheduleCache:
+    def __init__(
+        self,
+        max_entries: int,
+        max_variants: int = SCHEDULE_CACHE_MAX_VARIANTS,
+        ttl_seconds: float = SCHEDULE_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self.ttl_seconds = ttl_seconds
+        # variant -> (går ut, bytes)
+        self._entries: "OrderedDict[tuple[str, date], OrderedDict[str, tuple[float, bytes]]]" = OrderedDict()
+        # Generation per enhet: en beräkning som startade före en invalidering
+        # får inte skriva tillbaka ett gammalt resultat.
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def generation(self, unit_id: str) -> int:
+        with self._lock:
+            return self._generations.get(unit_id, 0)
+
+    def get(self, unit_id: str, day: date, variant: str = "") -> Optional[bytes]:
+        key = (unit_id, day)
+        with self._lock:
+            variants = self._entries.get(key)
+            entry = variants.get(variant) if variants is not None else None
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del variants[variant]
+                if not variants:
+                    del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, unit_id: str, day: date, value: bytes, generation: int, variant: str = "") -> None:
+        if self.max_entries <= 0:
+            return
+        key = (unit_id, day)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else float("inf")
+        with self._lock:
+            if self._generations.get(unit_id, 0) != generation:
+                return
+            variants = self._entries.setdefault(key, OrderedDict())
+            variants[variant] = (expires_at, value)
+            variants.move_to_end(variant)
+            while len(variants) > self.max_variants:
+                variants.popitem(last=False)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, unit_id: str, day: date) -> None:
+        with self._lock:
+            self._generations[unit_id] = self._generations.get(unit_id, 0) + 1
+            self._entries.pop((unit_id, day), None)
+
+    def invalidate_unit(self, unit_id: str) -> None:
+        with self._lock:
+            self._generations[unit_id] = self._generations.get(unit_id, 0) + 1
+            for key in [key for key in self._entries if key[0] == unit_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+day_schedule_cache = DayScheduleCache(SCHEDULE_CACHE_MAX_ENTRIES)
@@ -5,6 +5,10 @@ from datetime import date
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -36,6 +40,15 @@ class TaskInstanceUpdate(BaseModel):
     notes: Optional[str] = None
     report_data: Optional[dict] = None
 
+class TaskInstanceBatchItem(TaskInstanceUpdate):
+    template_id: str
+
+class TaskInstanceBatchResult(BaseModel):
+    template_id: str
+    date: date
+    status: str # 'success', 'not_found', 'error'
+    detail: Optional[str] = None
+
 class Task(BaseModel):
     id: str  # template_id
     unitId: str
@@ -65,6 +78,49 @@ class TaskCreate(BaseModel):
     valid_on_date: Optional[date] = None
     meta_data: Optional[dict] = {}
 
+class TaskImportRejection(BaseModel):
+    line: int
+    errors: List[str]
+
+class TaskImportResult(BaseModel):
+    inserted: int
+    rejected: List[TaskImportRejection]
+
 class DaySchedule(BaseModel):
     date: date
     tasks: List[Task]
+
+class UnitSchedule(BaseModel):
+    unitId: str
+    unitName: str
+    tasks: List[Task]
+
+class ScheduleOverview(BaseModel):
+    date: date
+    units: List[UnitSchedule]
+
+class RosterEntry(BaseModel):
+    unit_id: str
+    date: date
+    role_type: str
+    user_id: Optional[str] = None  # None tar bort passet i PUT /roster
+
+    class Config:
+        from_attributes = True
+
+class ScheduleChange(BaseModel):
+    seq: int
+    kind: str  # 'template', 'instance'
+    op: str  # 'upsert', 'delete'
+    templateId: str
+    date: Optional[date]  # instansens dag, eller mallens valid_on_date
+    # Instansens nuvarande läge (bara för kind='instance')
+    status: Optional[str] = None
+    signedBy: Optional[str] = None
+    signedAt: Optional[str] = None
+    reportData: Optional[dict] = None
+
+class ScheduleChanges(BaseModel):
+    cursor: int
+    hasMore: bool
+    changes: List[ScheduleChange]
@@ -1,9 +1,51 @@
+from datetime import date, timedelta
+
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
 from . import models, db
 from .auth import local_jwt
 
+# Vem som har vilket pass i demo-bemanningen (unit_id, role_type) -> user_id
+ROSTER_ROLES = {
+    ("u1", "morning_red"): "s1",  # Emma
+    ("u1", "morning_blue"): "s2",  # Johan
+    ("u1", "evening_red"): "s3",  # Maria
+    ("u1", "evening_blue"): "s10",  # Sofia
+    ("u1", "night_red"): "s4",  # Anders
+    ("u1", "night_blue"): "s11",  # Lukas
+    ("u2", "morning_red"): "s5",  # Karim
+    ("u2", "morning_blue"): "s6",  # Lena
+    ("u2", "evening_red"): "s7",  # Olof
+    ("u2", "evening_blue"): "s15",  # Sven
+    ("u2", "night_red"): "s16",  # Birgitta
+    ("u2", "night_blue"): "s17",  # Eva
+}
+# Bemanningen seedas runt dagens datum
+ROSTER_DAYS_BEFORE = 30
+ROSTER_DAYS_AFTER = 60
+
+
+def roster_rows(today: date) -> list[dict]:
+    return [
+        {"unit_id": unit_id, "date": today + timedelta(days=offset), "role_type": role_type, "user_id": user_id}
+        for offset in range(-ROSTER_DAYS_BEFORE, ROSTER_DAYS_AFTER + 1)
+        for (unit_id, role_type), user_id in ROSTER_ROLES.items()
+    ]
+
+
+def seed_roster(db_session: Session) -> None:
+    # Seedas separat från resten: databaser som seedades innan roster_entries
+    # fanns får bemanningen vid nästa start. Bara om tabellen är tom, så att
+    # pass som tagits bort via PUT /roster inte kommer tillbaka.
+    if db_session.query(models.RosterEntry.id).first() is not None:
+        return
+    print("Seeding roster...")
+    db_session.execute(insert(models.RosterEntry.__table__), roster_rows(date.today()))
+    db_session.commit()
+
+
 def seed_data():
     db_session = db.SessionLocal()
 
@@ -11,6 +53,7 @@ def seed_data():
     # Skip if admin user exists (to avoid locking and redundant work)
     if db_session.query(models.User).filter(models.User.id == "admin").first():
         print("Database already seeded. Skipping.")
+        seed_roster(db_session)
         db_session.close()
         return
 
@@ -97,22 +140,12 @@ def seed_data():
     except IntegrityError:
         db_session.rollback()
 
+    # --- ROSTER ---
+    seed_roster(db_session)
+
     # --- TASK TEMPLATES ---
     # Using data from frontend/lib/demo-data.ts
-    
-    # Assignees map:
-    # Morning Red: Emma (s1)
-    # Morning Blue: Johan (s2)
-    # Evening Red: Maria (s3)
-    # Evening Blue: Sofia (s10)
-    # Night Red: Anders (s4)
-    # Night Blue: Lukas (s11)
-    # U2 Morning Red: Karim (s5)
-    # U2 Morning Blue: Lena (s6)
-    # U2 Evening Red: Olof (s7)
-    # U2 Evening Blue: Sven (s15)
-    # U2 Night Red: Birgitta (s16)
-    # U2 Night Blue: Eva (s17)
+    # Passen (role_type) bemannas enligt ROSTER_ROLES
 
     tasks = [
         # ===========================================================================
@@ -0,0 +1,269 @@
+"""
+Syntetisk testdata i produktionsskala, för kapacitetstester av index och frågor.
+
+Bygger vidare på seed.py men skriver med Core-inserts i stora chunkar
+(executemany) i stället för en merge() per rad. Samma --seed ger exakt
+samma data; historiken slutar som standard på det fasta END_DATE, inte idag. Alla id:n börjar med "syn-" så att datan kan rensas med --reset
+utan att demo-datan påverkas.
+
+    python -m backend.app.synthetic --units 1000 --templates-per-unit 200 --days 730
+    python -m backend.app.synthetic --units 20 --days 30 --seed 7 --reset
+"""
+import argparse
+import random
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional
+
+from sqlalchemy import delete, insert
+from sqlalchemy.engine import Engine
+
+from . import models
+from .auth import local_jwt
+
+SYNTHETIC_PREFIX = "syn-"
+INSERT_CHUNK_SIZE = 5000
+
+# Fast slutdatum så att samma --seed ger samma data oavsett körningsdag
+END_DATE = date(2026, 1, 31)
+
+# Pass och tidsfönster som i seed.py
+SHIFT_WINDOWS = {
+    "morning_red": (7, 15),
+    "morning_blue": (7, 15),
+    "evening_red": (15, 22),
+    "evening_blue": (15, 22),
+    "night_red": (22, 31),
+    "night_blue": (22, 31),
+}
+CATEGORIES = ["HSL", "Care", "Service", "Social", "Admin"]
+UNIT_TYPES = ["lss", "sabo"]
+TITLES = {
+    "HSL": ["HSL Insats", "Medicinering", "Blodtryckskontroll", "Såromläggning"],
+    "Care": ["Morgonhygien", "Dusch", "Kvällsrutin", "Förflyttning"],
+    "Service": ["Tillsyn", "Städning", "Tvätt", "Inköp"],
+    "Social": ["Promenad", "Aktivitet", "Fika", "Läsning"],
+    "Admin": ["Rapport", "Dokumentation", "Beställning", "Genomförandeplan"],
+}
+# Statusfördelning för passerade dagar
+STATUS_WEIGHTS = [("completed", 70), ("signed", 12), ("missed", 8), ("pending", 10)]
+
+
+@dataclass
+class SyntheticConfig:
+    units: int = 10
+    staff_per_unit: int = 12
+    templates_per_unit: int = 60
+    days: int = 30
+    end_date: date = END_DATE
+    # Andel av (mall, dag) som har en instans; resten räknas som pending utan rad
+    instance_density: float = 0.9
+    # Andel mallar som bara gäller ett visst datum
+    dated_template_ratio: float = 0.05
+    seed: int = 42
+    password: str = "password123"
+
+
+def _chunks(rows: Iterator[dict], size: int) -> Iterator[list[dict]]:
+    chunk: list[dict] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _bulk_insert(engine: Engine, table, rows: Iterator[dict]) -> int:
+    count = 0
+    for chunk in _chunks(rows, INSERT_CHUNK_SIZE):
+        with engine.begin() as connection:
+            connection.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+def _unit_ids(config: SyntheticConfig) -> list[str]:
+    return [f"{SYNTHETIC_PREFIX}u{index}" for index in range(config.units)]
+
+
+def _staff_ids(unit_id: str, config: SyntheticConfig) -> list[str]:
+    return [f"{unit_id}-s{index}" for index in range(config.staff_per_unit)]
+
+
+def _unit_rows(config: SyntheticConfig, rng: random.Random) -> Iterator[dict]:
+    for index, unit_id in enumerate(_unit_ids(config)):
+        yield {"id": unit_id, "name": f"Syntetisk enhet {index}", "type": rng.choice(UNIT_TYPES)}
+
+
+def _user_rows(config: SyntheticConfig, pwd_hash: str) -> Iterator[dict]:
+    for unit_id in _unit_ids(config):
+        yield {
+            "id": f"{unit_id}-admin",
+            "username": f"{unit_id}-admin",
+            "name": f"Admin {unit_id}",
+            "role": "unit_admin",
+            "unit_id": unit_id,
+            "hashed_password": pwd_hash,
+            "auth_method": "local",
+            "is_disabled": False,
+        }
+        for staff_id in _staff_ids(unit_id, config):
+            yield {
+                "id": staff_id,
+                "username": staff_id,
+                "name": f"Personal {staff_id}",
+                "role": "staff",
+                "unit_id": unit_id,
+                "hashed_password": pwd_hash,
+                "auth_method": "local",
+                "is_disabled": False,
+            }
+
+
+def _admin_unit_rows(config: SyntheticConfig) -> Iterator[dict]:
+    for unit_id in _unit_ids(config):
+        yield {"user_id": f"{unit_id}-admin", "unit_id": unit_id}
+
+
+def _template_rows(config: SyntheticConfig, rng: random.Random) -> Iterator[dict]:
+    first_day = config.end_date - timedelta(days=config.days - 1)
+    roles = list(SHIFT_WINDOWS)
+    for unit_id in _unit_ids(config):
+        staff_ids = _staff_ids(unit_id, config)
+        for index in range(config.templates_per_unit):
+            role_type = roles[index % len(roles)]
+            category = rng.choice(CATEGORIES)
+            start_hour, end_hour = SHIFT_WINDOWS[role_type]
+            start_minutes = rng.randrange(start_hour * 60, end_hour * 60 - 30, 15)
+            duration = rng.choice([15, 30, 45, 60])
+            meta = {
+                "timeStart": f"{(start_minutes // 60) % 24:02d}:{start_minutes % 60:02d}",
+                "timeEnd": f"{((start_minutes + duration) // 60) % 24:02d}:{(start_minutes + duration) % 60:02d}",
+            }
+            if category == "HSL":
+                meta["requiresSign"] = True
+            if category == "Admin" and rng.random() < 0.2:
+                meta["isReportTask"] = True
+                meta["reportType"] = rng.choice(["night_to_day", "day_to_evening", "evening_to_night"])
+            if staff_ids and rng.random() < 0.3:
+                meta["assigneeId"] = rng.choice(staff_ids)
+
+            valid_on_date: Optional[date] = None
+            if rng.random() < config.dated_template_ratio:
+                valid_on_date = first_day + timedelta(days=rng.randrange(config.days))
+
+            yield {
+                "id": f"{unit_id}-t{index}",
+                "unit_id": unit_id,
+                "title": rng.choice(TITLES[category]),
+                "description": f"Syntetisk uppgift {index} för {unit_id}",
+                "substitute_instructions": "Se genomförandeplanen.",
+                "category": category,
+                "role_type": role_type,
+                "is_shared": rng.random() < 0.1,
+                "valid_on_date": valid_on_date,
+                "meta_data": meta,
+                **models.meta_columns(meta),
+            }
+
+
+def _instance_rows(config: SyntheticConfig, templates: list[dict], rng: random.Random) -> Iterator[dict]:
+    statuses = [status for status, _weight in STATUS_WEIGHTS]
+    weights = [weight for _status, weight in STATUS_WEIGHTS]
+    first_day = config.end_date - timedelta(days=config.days - 1)
+    for offset in range(config.days):
+        day = first_day + timedelta(days=offset)
+        for template in templates:
+            if template["valid_on_date"] is not None and template["valid_on_date"] != day:
+                continue
+            if rng.random() >= config.instance_density:
+                continue
+            status = rng.choices(statuses, weights)[0]
+            if status == "signed" and not template["requires_sign"]:
+                status = "completed"
+            signed_by = None
+            signed_at = None
+            if status in ("completed", "signed"):
+                signed_by = rng.choice(_staff_ids(template["unit_id"], config) or [None])
+                hour, minute = (int(part) for part in template["time_start"].split(":"))
+                signed_at = datetime(day.year, day.month, day.day, hour, minute).isoformat()
+            yield {
+                "template_id": template["id"],
+                "date": day,
+                "status": status,
+                "signed_by": signed_by,
+                "signed_at": signed_at,
+            }
+
+
+def reset_synthetic(engine: Engine) -> None:
+    like = f"{SYNTHETIC_PREFIX}%"
+    with engine.begin() as connection:
+        connection.execute(delete(models.TaskInstance.__table__).where(models.TaskInstance.template_id.like(like)))
+        connection.execute(delete(models.TaskTemplate.__table__).where(models.TaskTemplate.id.like(like)))
+        connection.execute(delete(models.admin_units).where(models.admin_units.c.unit_id.like(like)))
+        connection.execute(delete(models.User.__table__).where(models.User.id.like(like)))
+        connection.execute(delete(models.Unit.__table__).where(models.Unit.id.like(like)))
+
+
+def generate(engine: Engine, config: SyntheticConfig) -> dict[str, int]:
+    """Skriv ett syntetiskt dataset. Kräver att eventuell tidigare syntetisk data rensats."""
+    rng = random.Random(config.seed)
+    # Hash once
+    pwd_hash = local_jwt.get_password_hash(config.password)
+
+    counts = {
+        "units": _bulk_insert(engine, models.Unit.__table__, _unit_rows(config, rng)),
+        "users": _bulk_insert(engine, models.User.__table__, _user_rows(config, pwd_hash)),
+        "admin_units": _bulk_insert(engine, models.admin_units, _admin_unit_rows(config)),
+    }
+    templates = list(_template_rows(config, rng))
+    counts["task_templates"] = _bulk_insert(engine, models.TaskTemplate.__table__, iter(templates))
+    counts["task_instances"] = _bulk_insert(
+        engine, models.TaskInstance.__table__, _instance_rows(config, templates, rng)
+    )
+    return counts
+
+
+if __name__ == "__main__":
+    from . import db, migrations
+
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser(description="Generera syntetisk testdata")
+    parser.add_argument("--units", type=int, default=defaults.units)
+    parser.add_argument("--staff-per-unit", type=int, default=defaults.staff_per_unit)
+    parser.add_argument("--templates-per-unit", type=int, default=defaults.templates_per_unit)
+    parser.add_argument("--days", type=int, default=defaults.days, help="dagar av TaskInstance-historik")
+    parser.add_argument(
+        "--end-date", type=date.fromisoformat, default=defaults.end_date,
+        help=f"sista dagen med historik (standard {defaults.end_date})",
+    )
+    parser.add_argument("--instance-density", type=float, default=defaults.instance_density)
+    parser.add_argument("--dated-template-ratio", type=float, default=defaults.dated_template_ratio)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--reset", action="store_true", help="ta bort befintlig syntetisk data först")
+    args = parser.parse_args()
+
+    config = SyntheticConfig(
+        units=args.units,
+        staff_per_unit=args.staff_per_unit,
+        templates_per_unit=args.templates_per_unit,
+        days=args.days,
+        end_date=args.end_date,
+        instance_density=args.instance_density,
+        dated_template_ratio=args.dated_template_ratio,
+        seed=args.seed,
+    )
+
+    migrations.migrate(db.engine)
+    if args.reset:
+        reset_synthetic(db.engine)
+    started = time.perf_counter()
+    counts = generate(db.engine, config)
+    elapsed = time.perf_counter() - started
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print(f"Generated in {elapsed:.1f}s")
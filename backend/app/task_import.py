@@ -0,0 +1,219 @@
+"""
+Massimport av uppgiftsmallar från CSV eller NDJSON.
+
+Raderna läses strömmande och valideras mot schemas.TaskCreate i chunkar.
+Giltiga rader skrivs med en executemany per chunk (SQLite) eller COPY
+(Postgres via psycopg2). Ogiltiga rader rapporteras med radnummer utan att
+resten av importen avbryts. Varje importerad mall loggas i
+schedule_changes (changes.py) i samma transaktion. I Postgres låses
+ändringsloggen för alla enheter vid första chunken och till commit.
+
+    python -m backend.app.task_import uppgifter.csv
+    python -m backend.app.task_import uppgifter.ndjson --format ndjson
+"""
+import csv
+import io
+import json
+import uuid
+from typing import IO, Iterable, Iterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.engine import Connection
+
+from . import changes, models, schemas
+
+IMPORT_CHUNK_SIZE = 1000
+
+# Ordningen är också kolumnordningen i COPY
+TEMPLATE_COLUMNS = [
+    "id",
+    "unit_id",
+    "title",
+    "description",
+    "substitute_instructions",
+    "category",
+    "role_type",
+    "is_shared",
+    "valid_on_date",
+    "meta_data",
+    "time_start",
+    "time_end",
+    "requires_sign",
+    "is_report_task",
+    "report_type",
+    "assignee_id",
+]
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str] = None) -> str:
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or (content_type or "").endswith("ndjson"):
+        return "ndjson"
+    return "csv"
+
+
+def iter_rows(stream: IO[str], fmt: str) -> Iterator[tuple[int, object]]:
+    """Ger (radnummer, rå rad). Radnumren räknar från 1 och avser datarader."""
+    if fmt == "ndjson":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield line_number, exc
+        return
+
+    for line_number, row in enumerate(csv.DictReader(stream), start=1):
+        # Tomma CSV-fält betyder "inget värde"
+        cleaned = {key: value for key, value in row.items() if key and value not in ("", None)}
+        if isinstance(cleaned.get("meta_data"), str):
+            try:
+                cleaned["meta_data"] = json.loads(cleaned["meta_data"])
+            except json.JSONDecodeError as exc:
+                yield line_number, exc
+                continue
+        yield line_number, cleaned
+
+
+def _format_errors(exc: Exception) -> list[str]:
+    if isinstance(exc, ValidationError):
+        return [
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            for error in exc.errors()
+        ]
+    return [str(exc)]
+
+
+def _to_row(task: schemas.TaskCreate) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "unit_id": task.unit_id,
+        "title": task.title,
+        "description": task.description,
+        "substitute_instructions": task.substitute_instructions,
+        "category": task.category,
+        "role_type": task.role_type,
+        "is_shared": task.is_shared,
+        "valid_on_date": task.valid_on_date,
+        "meta_data": task.meta_data,
+        **models.meta_columns(task.meta_data),
+    }
+
+
+def _copy_rows(connection: Connection, rows: list[dict]) -> bool:
+    """COPY FROM STDIN för Postgres. Returnerar False om drivern saknar stöd."""
+    cursor = connection.connection.cursor()
+    if not hasattr(cursor, "copy_expert"):
+        cursor.close()
+        return False
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        values = []
+        for column in TEMPLATE_COLUMNS:
+            value = row[column]
+            if column == "meta_data" and value is not None:
+                value = json.dumps(value, ensure_ascii=False)
+            elif value is None:
+                value = ""
+            values.append(value)
+        writer.writerow(values)
+    buffer.seek(0)
+
+    try:
+        cursor.copy_expert(
+            f"COPY task_templates ({', '.join(TEMPLATE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+    return True
+
+
+def _insert_rows(connection: Connection, rows: list[dict]) -> None:
+    if connection.dialect.name == "postgresql" and _copy_rows(connection, rows):
+        return
+    # executemany: en förberedd sats för hela chunken
+    connection.execute(insert(models.TaskTemplate.__table__), rows)
+
+
+def import_tasks(
+    connection: Connection,
+    raw_rows: Iterable[tuple[int, object]],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> dict:
+    """
+    Validera och skriv rader chunkvis på `connection`. Anroparen äger
+    transaktionen och invaliderar schemacachen för `affected_units` efter
+    commit. Returnerar {"inserted": n, "rejected": [...], "affected_units": {...}}.
+    """
+    table = models.Unit.__table__
+    known_units = {row.id for row in connection.execute(table.select().with_only_columns(table.c.id))}
+
+    inserted = 0
+    rejected: list[dict] = []
+    affected_units: set[str] = set()
+    chunk: list[dict] = []
+
+    locked = False
+
+    def flush() -> None:
+        nonlocal inserted, locked
+        if chunk:
+            if not locked:
+                # Alla enheter på en gång, sorterat: inget dödläge mot andra skrivare
+                lock = changes.lock_units(connection.dialect.name, known_units)
+                if lock is not None:
+                    connection.execute(lock)
+                locked = True
+            _insert_rows(connection, chunk)
+            connection.execute(changes.insert_changes(), [
+                changes.change_row(row["unit_id"], changes.KIND_TEMPLATE, changes.OP_UPSERT, row["id"], row["valid_on_date"])
+                for row in chunk
+            ])
+            inserted += len(chunk)
+            chunk.clear()
+
+    for line_number, raw in raw_rows:
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            task = schemas.TaskCreate.model_validate(raw)
+        except (ValidationError, ValueError) as exc:
+            rejected.append({"line": line_number, "errors": _format_errors(exc)})
+            continue
+        if task.unit_id not in known_units:
+            rejected.append({"line": line_number, "errors": [f"unit_id: unknown unit '{task.unit_id}'"]})
+            continue
+
+        chunk.append(_to_row(task))
+        affected_units.add(task.unit_id)
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+
+    return {"inserted": inserted, "rejected": rejected, "affected_units": affected_units}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from . import db
+
+    parser = argparse.ArgumentParser(description="Importera uppgiftsmallar från CSV/NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None)
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    with open(args.path, encoding="utf-8-sig", newline="") as stream, db.engine.begin() as connection:
+        result = import_tasks(connection, iter_rows(stream, fmt), chunk_size=args.chunk_size)
+
+    print(f"Inserted: {result['inserted']}")
+    print(f"Rejected: {len(result['rejected'])}")
+    for rejection in result["rejected"]:
+        print(f"  line {rejection['line']}: {'; '.join(rejection['errors'])}")
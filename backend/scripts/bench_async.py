@@ -0,0 +1,160 @@
+"""
+Jämför genomströmning under samtidig last med DB_ASYNC=false och DB_ASYNC=true.
+
+Ett syntetiskt dataset genereras en gång i en SQLite-fil. Sedan körs varje
+läge i en egen process (DB_ASYNC läses vid import) med appen in-process via
+httpx.ASGITransport. `--concurrency` klienter anropar /schedule/day (ocachad,
+med assigneeId), /schedule/overview och /staff om vartannat. Trådpoolens
+storlek kan sättas med --threadpool för att se taket för de synkrona routerna.
+Med få trådar och många samtidiga anrop kan synkront läge ge pool-timeouts:
+en session lämnar tillbaka sin anslutning först när dess cleanup fått en tråd.
+
+    cd backend
+    python scripts/bench_async.py --requests 2000 --concurrency 100
+    python scripts/bench_async.py --database-url postgresql+psycopg2://...   # befintlig databas
+
+Kräver httpx samt aiosqlite (SQLite) eller asyncpg (Postgres).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from bench_utils import percentile
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+END_DATE = date(2026, 1, 31)
+
+
+def prepare(units: int, templates_per_unit: int) -> None:
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app import db, migrations, synthetic
+
+    migrations.migrate(db.engine)
+    synthetic.reset_synthetic(db.engine)
+    config = synthetic.SyntheticConfig(
+        units=units, templates_per_unit=templates_per_unit, days=30, end_date=END_DATE,
+    )
+    synthetic.generate(db.engine, config)
+
+
+async def run_mode(requests: int, concurrency: int, threadpool: int) -> dict:
+    sys.path.insert(0, str(BACKEND_DIR))
+    import anyio.to_thread
+    import httpx
+
+    from app import synthetic
+    from app.main import app
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = threadpool
+
+    unit_id = f"{synthetic.SYNTHETIC_PREFIX}u0"
+    day = END_DATE.isoformat()
+    # 500-svar (t.ex. pool-timeout) räknas som fel i stället för att avbryta körningen
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post(
+            "/token", data={"username": f"{unit_id}-admin", "password": "password123"},
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        calls = [
+            lambda: client.get("/schedule/day", params={"unitId": unit_id, "date": day, "assigneeId": f"{unit_id}-s0"}),
+            lambda: client.get("/schedule/overview", params={"date": day}, headers=headers),
+            lambda: client.get("/staff", headers=headers),
+        ]
+        latencies: list[float] = []
+        errors = 0
+        counter = iter(range(requests))
+
+        async def worker() -> None:
+            nonlocal errors
+            for index in counter:
+                started = time.perf_counter()
+                response = await calls[index % len(calls)]()
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--threadpool", type=int, default=40, help="anyio:s standard är 40 trådar")
+    parser.add_argument("--units", type=int, default=5)
+    parser.add_argument("--templates-per-unit", type=int, default=100)
+    parser.add_argument("--database-url", default=None, help="befintlig databas med syntetisk data")
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--run-mode", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        prepare(args.units, args.templates_per_unit)
+        return 0
+    if args.run_mode:
+        print(json.dumps(asyncio.run(run_mode(args.requests, args.concurrency, args.threadpool))))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": args.database_url or f"sqlite:///{Path(tmp) / 'bench.db'}",
+            "DB_STARTUP_MODE": "off",
+        }
+        env.setdefault("SECRET_KEY", "benchmark")
+        env.setdefault("ALGORITHM", "HS256")
+        env.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+        if args.database_url is None:
+            subprocess.run(
+                [sys.executable, __file__, "--prepare", "--units", str(args.units),
+                 "--templates-per-unit", str(args.templates_per_unit)],
+                env=env, check=True,
+            )
+
+        results = {}
+        for mode in ("false", "true"):
+            print(f"Running DB_ASYNC={mode} ...", file=sys.stderr)
+            completed = subprocess.run(
+                [sys.executable, __file__, "--run-mode", "--requests", str(args.requests),
+                 "--concurrency", str(args.concurrency), "--threadpool", str(args.threadpool)],
+                env={**env, "DB_ASYNC": mode},
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            results["async" if mode == "true" else "sync"] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print(json.dumps(
+        {"concurrency": args.concurrency, "threadpool": args.threadpool, "results": results},
+        indent=2,
+    ))
+    sync_rps = results["sync"]["throughput_rps"]
+    print(f"async/sync throughput: {results['async']['throughput_rps'] / sync_rps:.2f}x", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Benchmark för upprepade OIDC-inloggningar av samma användare.
+
+Anropar get_or_create_oidc_user direkt med syntetiska claims (ingen
+signaturkontroll) för `--users` användare i `--rounds` varv och räknar
+SQL-satser och commits via SQLAlchemy-events. Körs mot en tillfällig
+SQLite-databas, så inga bench-användare hamnar i den riktiga.
+
+    cd backend
+    python scripts/bench_oidc_login.py --users 50 --rounds 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmp.name) / 'oidc.db'}"
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+sys.path.insert(0, str(BACKEND_DIR))
+
+from sqlalchemy import event  # noqa: E402
+
+from app import db, migrations  # noqa: E402
+from app.auth import oidc  # noqa: E402
+
+
+def run(users: int, rounds: int) -> None:
+    migrations.migrate(db.engine)
+    counters = {"statements": 0, "commits": 0}
+
+    @event.listens_for(db.engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        counters["statements"] += 1
+
+    @event.listens_for(db.engine, "commit")
+    def count_commit(conn):
+        counters["commits"] += 1
+
+    claims = [
+        {
+            "oid": f"bench-oid-{index}",
+            "tid": "bench-tenant",
+            "preferred_username": f"bench-user-{index}@example.com",
+            "name": f"Bench User {index}",
+        }
+        for index in range(users)
+    ]
+
+    for round_number in range(rounds):
+        counters.update(statements=0, commits=0)
+        started = time.perf_counter()
+        session = db.SessionLocal()
+        try:
+            for user_claims in claims:
+                oidc.get_or_create_oidc_user(session, user_claims)
+        finally:
+            session.close()
+        elapsed = time.perf_counter() - started
+        if round_number in (0, 1, rounds - 1):
+            print(
+                f"round {round_number + 1:>3}: {elapsed * 1000 / users:.2f} ms/login  "
+                f"{counters['statements'] / users:.2f} statements/login  "
+                f"{counters['commits']} commits"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    run(args.users, max(args.rounds, 1))
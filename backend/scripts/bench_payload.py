@@ -0,0 +1,103 @@
+"""
+Bytes på tråden för schemasvaren: fälturval × format × komprimering.
+
+Startar appen mot en tillfällig SQLite-databas med syntetisk data och hämtar
+/schedule/day och /schedule/range (en vecka) i varje läge. Storleken är det
+som faktiskt skickas (efter komprimering), inte den avkodade kroppen.
+
+    cd backend
+    python scripts/bench_payload.py --templates 50 200
+    python scripts/bench_payload.py --fields id,status,title
+
+Kräver httpx (för TestClient); msgpack och brotli hoppas över om de saknas.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmp.name) / 'payload.db'}"
+os.environ["DB_STARTUP_MODE"] = "auto"
+os.environ["SCHEDULE_CACHE_MAX_ENTRIES"] = "0"
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import compression, db, payload, synthetic  # noqa: E402
+from app.main import app  # noqa: E402
+
+DAY = date(2026, 1, 31)
+DEFAULT_FIELDS = "id,status,title,roleType"
+
+
+def wire_bytes(client: TestClient, path: str, params: dict, accept: str, encoding: str) -> int:
+    headers = {"Accept": accept, "Accept-Encoding": encoding}
+    with client.stream("GET", path, params=params, headers=headers) as response:
+        response.raise_for_status()
+        served = response.headers.get("content-encoding", "identity")
+        if served != encoding:
+            raise RuntimeError(f"{path}: asked for {encoding}, got {served}")
+        return sum(len(chunk) for chunk in response.iter_raw())
+
+
+def modes(fields: str) -> list[tuple[str, str, str, str]]:
+    media_types = [payload.JSON_MEDIA_TYPE]
+    if payload.msgpack is not None:
+        media_types.append(payload.MSGPACK_MEDIA_TYPE)
+    encodings = ["identity", "gzip"]
+    if compression.brotli is not None:
+        encodings.append("br")
+    return [
+        (field_label, field_value, media_type, encoding)
+        for field_label, field_value in (("full", ""), ("fields", fields))
+        for media_type in media_types
+        for encoding in encodings
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--templates", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--fields", default=DEFAULT_FIELDS, help=f"fälturval för fields-läget (standard {DEFAULT_FIELDS})")
+    args = parser.parse_args()
+
+    print(f"fields={args.fields}  compression threshold={compression.RESPONSE_COMPRESSION_MIN_BYTES} B")
+    with TestClient(app) as client:
+        for count in args.templates:
+            synthetic.reset_synthetic(db.engine)
+            synthetic.generate(db.engine, synthetic.SyntheticConfig(
+                units=1, templates_per_unit=count, days=7, end_date=DAY, dated_template_ratio=0,
+            ))
+            unit_id = f"{synthetic.SYNTHETIC_PREFIX}u0"
+            endpoints = [
+                ("day", "/schedule/day", {"unitId": unit_id, "date": DAY.isoformat()}),
+                ("range 7d", "/schedule/range", {
+                    "unitId": unit_id, "from": (DAY - timedelta(days=6)).isoformat(), "to": DAY.isoformat(),
+                }),
+            ]
+
+            print(f"\n{count} templates")
+            print(f"{'endpoint':<9} {'fields':<7} {'format':<20} {'encoding':<9} {'bytes':>10} {'vs full json':>13}")
+            for label, path, params in endpoints:
+                baseline = None
+                for field_label, fields, media_type, encoding in modes(args.fields):
+                    query = {**params, "fields": fields} if fields else params
+                    size = wire_bytes(client, path, query, media_type, encoding)
+                    baseline = baseline or size
+                    print(
+                        f"{label:<9} {field_label:<7} {media_type:<20} {encoding:<9} "
+                        f"{size:>10} {size / baseline:>12.1%}"
+                    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
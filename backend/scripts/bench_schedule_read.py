@@ -0,0 +1,116 @@
+"""
+Kostnad per uppgift för dagsschemat: gamla ORM-vägen mot den smala läsvägen.
+
+Gamla vägen (återskapad här): två ORM-frågor, dict per uppgift och sedan
+response_model-validering + JSON-kodning som FastAPI gör. Nya vägen:
+api._day_rows_stmt (kolumnurval med LEFT JOIN) och api._day_schedule_body
+(dict direkt från raderna, orjson). Ingen cache och ingen HTTP, så att bara
+läsvägen mäts.
+
+    cd backend
+    python scripts/bench_schedule_read.py --templates 100 500 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmp.name) / 'read.db'}"
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app import db, migrations, models, payload, schemas, synthetic  # noqa: E402
+from app.routers import api  # noqa: E402
+
+DAY = date(2026, 1, 31)
+day_schedule_adapter = TypeAdapter(schemas.DaySchedule)
+
+
+def legacy_day_schedule(db_session, unit_id: str, day: date) -> bytes:
+    templates = db_session.query(models.TaskTemplate).filter(
+        models.TaskTemplate.unit_id == unit_id,
+        (models.TaskTemplate.valid_on_date == None) | (models.TaskTemplate.valid_on_date == day),
+    ).order_by(*api.TEMPLATE_ORDER).all()
+    instances = db_session.query(models.TaskInstance).filter(
+        models.TaskInstance.date == day,
+        models.TaskInstance.template_id.in_([t.id for t in templates]),
+    ).all()
+    instance_map = {i.template_id: i for i in instances}
+    tasks = []
+    for t in templates:
+        inst = instance_map.get(t.id)
+        tasks.append(api._build_task(
+            t, api._decode_meta(t.meta_data), inst.status if inst else "pending",
+            inst.report_data if inst else None,
+        ))
+    # Som FastAPI med response_model: validera, sedan jsonable_encoder + json
+    validated = day_schedule_adapter.validate_python({"date": day, "tasks": tasks})
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+def lean_day_schedule(db_session, unit_id: str, day: date) -> bytes:
+    rows = db_session.execute(api._day_rows_stmt([unit_id], day)).all()
+    return api._day_schedule_body(day, rows)
+
+
+def measure(fn, iterations: int) -> float:
+    timings = []
+    for _ in range(iterations):
+        session = db.SessionLocal()
+        try:
+            started = time.perf_counter()
+            fn(session)
+            timings.append(time.perf_counter() - started)
+        finally:
+            session.close()
+    return statistics.median(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--templates", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--iterations", type=int, default=30)
+    args = parser.parse_args()
+
+    migrations.migrate(db.engine)
+    print(f"encoder: {'orjson' if payload.orjson is not None else 'json'}")
+    print(f"{'tasks':>7} {'legacy ms':>10} {'lean ms':>9} {'legacy µs/task':>15} {'lean µs/task':>13} {'speedup':>8}")
+    for count in args.templates:
+        synthetic.reset_synthetic(db.engine)
+        synthetic.generate(db.engine, synthetic.SyntheticConfig(
+            units=1, templates_per_unit=count, days=1, end_date=DAY, dated_template_ratio=0,
+        ))
+        unit_id = f"{synthetic.SYNTHETIC_PREFIX}u0"
+
+        session = db.SessionLocal()
+        try:
+            if json.loads(legacy_day_schedule(session, unit_id, DAY)) != json.loads(lean_day_schedule(session, unit_id, DAY)):
+                print(f"{count}: responses differ", file=sys.stderr)
+                return 1
+        finally:
+            session.close()
+
+        legacy = measure(lambda s: legacy_day_schedule(s, unit_id, DAY), args.iterations)
+        lean = measure(lambda s: lean_day_schedule(s, unit_id, DAY), args.iterations)
+        print(
+            f"{count:>7} {legacy * 1000:>10.2f} {lean * 1000:>9.2f} "
+            f"{legacy / count * 1e6:>15.1f} {lean / count * 1e6:>13.1f} {legacy / lean:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
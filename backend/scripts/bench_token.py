@@ -0,0 +1,98 @@
+"""
+Benchmark för /token under samtidig last.
+
+Kör appen in-process (httpx.ASGITransport, ingen nätverksstack) mot en
+tillfällig SQLite-databas och skickar
+`--logins` inloggningar med `--concurrency` samtidiga klienter. Samtidigt
+pollas `GET /` för att mäta hur mycket event-loopen blockeras av hashningen.
+
+    cd backend
+    python scripts/bench_token.py --logins 200 --concurrency 20
+
+Kräver httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmp.name) / 'token.db'}"
+os.environ["DB_STARTUP_MODE"] = "auto"
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+from bench_utils import percentile  # noqa: E402
+
+from app import seed  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+async def run(logins: int, concurrency: int, username: str, password: str) -> None:
+    seed.seed_data()
+    transport = httpx.ASGITransport(app=app)
+    statuses: dict[int, int] = {}
+    login_latencies: list[float] = []
+    probe_latencies: list[float] = []
+    remaining = iter(range(logins))
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def login_worker() -> None:
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.post("/token", data={"username": username, "password": password})
+                login_latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        async def probe() -> None:
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    print(f"logins: {logins}  concurrency: {concurrency}  elapsed: {elapsed:.2f}s")
+    print(f"throughput: {logins / elapsed:.1f} req/s  statuses: {statuses}")
+    print(
+        "login latency ms  p50 {:.1f}  p95 {:.1f}  p99 {:.1f}".format(
+            *(percentile(login_latencies, p) * 1000 for p in (50, 95, 99))
+        )
+    )
+    if probe_latencies:
+        print(
+            "GET / during load ms  p50 {:.1f}  p95 {:.1f}  max {:.1f}  (n={})".format(
+                percentile(probe_latencies, 50) * 1000,
+                percentile(probe_latencies, 95) * 1000,
+                max(probe_latencies) * 1000,
+                len(probe_latencies),
+            )
+        )
+        print(f"mean GET / ms: {statistics.mean(probe_latencies) * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="password123")
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.concurrency, args.username, args.password))
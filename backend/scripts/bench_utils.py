@@ -0,0 +1,10 @@
+"""Gemensamma hjälpfunktioner för benchmark-skripten i scripts/."""
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Närmaste-rang-percentil; 0.0 för en tom lista."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,205 @@
+"""
+Benchmarksvit för API:t mot syntetiska dataset i flera storlekar.
+
+Varje storlek körs i en egen process med en egen SQLite-fil (DATABASE_URL
+läses vid import). Appen körs in-process via FastAPI:s TestClient och
+datan genereras med app.synthetic. För varje mätpunkt rapporteras
+p50/p95/p99-latens och genomströmning (seriella anrop/s).
+
+    cd backend
+    python scripts/benchmark.py --sizes small medium --output bench.json
+    python scripts/benchmark.py --save-baseline          # spara nuvarande som baseline
+    python scripts/benchmark.py                          # jämför mot baseline, exit 1 vid regression
+
+Baseline är maskinberoende och checkas därför inte in; skapa den på
+maskinen där jämförelsen ska göras. Kräver httpx (för TestClient).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from bench_utils import percentile
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_BASELINE = Path(__file__).resolve().with_name("benchmark_baseline.json")
+
+SIZES = {
+    "small": {"units": 5, "templates_per_unit": 40, "days": 14},
+    "medium": {"units": 50, "templates_per_unit": 100, "days": 60},
+    "large": {"units": 200, "templates_per_unit": 250, "days": 180},
+}
+END_DATE = date(2026, 1, 31)
+
+
+def measure(fn, iterations: int, setup=None) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    total = sum(latencies)
+    return {
+        "n": iterations,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(iterations / total, 1) if total else None,
+    }
+
+
+def run_size(size: str, iterations: int, token_iterations: int) -> dict:
+    """Körs i barnprocessen; DATABASE_URL är redan satt."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from fastapi.testclient import TestClient
+
+    from app import db, synthetic
+    from app.auth import authenticated_user_cache, get_current_user_hybrid
+    from app.main import app
+    from app.schedule_cache import day_schedule_cache
+
+    config = synthetic.SyntheticConfig(end_date=END_DATE, **SIZES[size])
+    synthetic.generate(db.engine, config)
+
+    unit_id = f"{synthetic.SYNTHETIC_PREFIX}u0"
+    template_id = f"{unit_id}-t0"
+    username = f"{unit_id}-admin"
+    day = END_DATE.isoformat()
+    results: dict[str, dict] = {}
+
+    with TestClient(app) as client:
+        token = client.post("/token", data={"username": username, "password": config.password}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        def check(response):
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.request.url} -> {response.status_code}")
+
+        results["schedule_day"] = measure(
+            lambda: check(client.get("/schedule/day", params={"unitId": unit_id, "date": day})),
+            iterations,
+            setup=day_schedule_cache.clear,
+        )
+        results["schedule_day_cached"] = measure(
+            lambda: check(client.get("/schedule/day", params={"unitId": unit_id, "date": day})),
+            iterations,
+        )
+
+        counter = iter(range(10**9))
+
+        def patch_instance():
+            # Ny dag varje gång: blandning av insert och update i upserten
+            target = END_DATE - timedelta(days=next(counter) % 30)
+            check(client.patch(
+                f"/task-instances/{template_id}",
+                json={"date": target.isoformat(), "status": "completed", "signed_by": username},
+            ))
+
+        results["patch_task_instance"] = measure(patch_instance, iterations)
+        results["staff"] = measure(lambda: check(client.get("/staff", headers=headers)), iterations)
+        results["token"] = measure(
+            lambda: check(client.post("/token", data={"username": username, "password": config.password})),
+            token_iterations,
+        )
+
+        def call_hybrid():
+            session = db.SessionLocal()
+            try:
+                get_current_user_hybrid(token=token, db_session=session)
+            finally:
+                session.close()
+
+        results["hybrid_auth"] = measure(call_hybrid, iterations, setup=authenticated_user_cache.clear)
+        results["hybrid_auth_cached"] = measure(call_hybrid, iterations)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for size, endpoints in results.items():
+        for endpoint, stats in endpoints.items():
+            reference = baseline.get(size, {}).get(endpoint)
+            if not reference:
+                continue
+            limit = reference["p95_ms"] * (1 + tolerance)
+            if stats["p95_ms"] > limit:
+                regressions.append(
+                    f"{size}/{endpoint}: p95 {stats['p95_ms']:.2f} ms > {limit:.2f} ms "
+                    f"(baseline {reference['p95_ms']:.2f} ms + {tolerance:.0%})"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--token-iterations", type=int, default=5, help="/token är avsiktligt dyr")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="tillåten p95-ökning, 0.25 = 25 %%")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--run-size", choices=list(SIZES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size:
+        print(json.dumps(run_size(args.run_size, args.iterations, args.token_iterations)))
+        return 0
+
+    results = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                "DATABASE_URL": f"sqlite:///{Path(tmp) / 'bench.db'}",
+                "DB_STARTUP_MODE": "auto",
+            }
+            env.setdefault("SECRET_KEY", "benchmark")
+            env.setdefault("ALGORITHM", "HS256")
+            env.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+            print(f"Running {size} {SIZES[size]} ...", file=sys.stderr)
+            completed = subprocess.run(
+                [
+                    sys.executable, __file__, "--run-size", size,
+                    "--iterations", str(args.iterations),
+                    "--token-iterations", str(args.token_iterations),
+                ],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            # Sista raden är JSON; seed/cold-start-utskrifter kan komma före
+            results[size] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    report = {"generated_at": datetime.utcnow().isoformat(), "sizes": SIZES, "results": results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    print(output)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; skipping regression check", file=sys.stderr)
+        return 0
+
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
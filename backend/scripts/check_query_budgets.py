@@ -0,0 +1,210 @@
+"""
+Kontrollera att varje route håller sin frågebudget (app.query_budget).
+
+Startar appen mot en tillfällig SQLite-databas med demo-datan, anropar varje
+route med ett representativt anrop och räknar SQL-satserna. Användar- och
+dagsschema-cachen töms före varje anrop så att värsta fallet mäts. Exit 1
+om en route saknar budget eller överskrider den; de inspelade satserna
+skrivs ut så att t.ex. en N+1 syns direkt.
+
+    cd backend
+    python scripts/check_query_budgets.py
+    DB_ASYNC=true python scripts/check_query_budgets.py   # de asynkrona routerna
+
+Kräver httpx (för TestClient).
+"""
+import io
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmp.name) / 'budget.db'}"
+os.environ["DB_STARTUP_MODE"] = "auto"
+# SSE-strömmen avslutas direkt efter retry-raden så att TestClient kan läsa klart svaret
+os.environ["SSE_MAX_CONNECTION_SECONDS"] = "0"
+os.environ.setdefault("SECRET_KEY", "query-budget")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.routing import APIRoute  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import db, query_budget  # noqa: E402
+from app.auth import authenticated_user_cache  # noqa: E402
+from app.main import app  # noqa: E402
+from app.routers import api_async_router, api_router, local_auth, oidc_auth  # noqa: E402
+from app.schedule_cache import day_schedule_cache  # noqa: E402
+
+DAY = "2026-01-12"
+# Demo-bemanningen seedas runt dagens datum
+TODAY = date.today().isoformat()
+WEEK_END = (date.today() + timedelta(days=6)).isoformat()
+PASSWORD = "password123"
+
+# Routes som inte kan anropas här (kräver en riktig identitetsleverantör)
+NOT_EXERCISED = {("GET", "/oidc/me")}
+
+
+class RouteCapture:
+    """Sparar vilken route som hanterade senaste anropet (Starlette sätter scope["route"])."""
+
+    def __init__(self, app):
+        self.app = app
+        self.route = None
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http":
+                self.route = scope.get("route")
+
+
+def declared_routes() -> list[APIRoute]:
+    routes = []
+    for router in (local_auth.router, oidc_auth.router, api_router.router, api_async_router.router):
+        routes.extend(route for route in router.routes if isinstance(route, APIRoute))
+    routes.extend(
+        route for route in app.router.routes
+        if isinstance(route, APIRoute) and route.include_in_schema is not None
+        and not route.path.startswith(("/docs", "/redoc", "/openapi"))
+    )
+    return routes
+
+
+def route_label(route: APIRoute) -> str:
+    return f"{'/'.join(sorted(route.methods))} {route.path} ({route.endpoint.__module__})"
+
+
+def main() -> int:
+    failures = 0
+
+    missing = [route for route in declared_routes() if query_budget.get_budget(route.endpoint) is None]
+    for route in missing:
+        print(f"MISSING BUDGET {route_label(route)}")
+    failures += len(missing)
+
+    engines = [db.engine]
+    if db.async_engine is not None:
+        engines.append(db.async_engine.sync_engine)
+
+    capture = RouteCapture(app)
+    with TestClient(capture) as client:
+        def login(username: str) -> dict:
+            response = client.post("/token", data={"username": username, "password": PASSWORD})
+            response.raise_for_status()
+            return response.json()
+
+        tokens = {username: login(username) for username in ("admin", "kronan_admin", "emma")}
+        auth = {
+            username: {"Authorization": f"Bearer {token['access_token']}"}
+            for username, token in tokens.items()
+        }
+        template_id = client.get("/schedule/day", params={"unitId": "u1", "date": DAY}).json()["tasks"][0]["id"]
+        doomed_id = client.post(
+            "/tasks", json={"unit_id": "u1", "title": "Budget", "category": "Admin", "role_type": "morning_red"},
+        ).json()["id"]
+        revoke_token = login("emma")["refresh_token"]
+        import_csv = "unit_id,title,category,role_type\nu1,Import 1,Admin,morning_red\nu1,Import 2,Care,evening_red\n"
+
+        def batch_patch(items: int):
+            start = date(2026, 1, 1)
+            return client.patch("/task-instances", json=[
+                {"template_id": template_id, "date": str(start + timedelta(days=offset)), "status": "completed"}
+                for offset in range(items)
+            ])
+
+        # (metod, route-mall, anrop[, antal poster för budget per post])
+        scenarios = [
+            ("GET", "/", lambda: client.get("/")),
+            ("GET", "/health", lambda: client.get("/health")),
+            ("GET", "/metrics", lambda: client.get("/metrics")),
+            ("POST", "/token", lambda: client.post("/token", data={"username": "kronan_admin", "password": PASSWORD})),
+            ("POST", "/token/refresh", lambda: client.post(
+                "/token/refresh", json={"refresh_token": tokens["kronan_admin"]["refresh_token"]})),
+            ("POST", "/token/revoke", lambda: client.post("/token/revoke", json={"refresh_token": revoke_token})),
+            ("POST", "/token/revoke-all", lambda: client.post("/token/revoke-all", headers=auth["emma"])),
+            ("GET", "/me", lambda: client.get("/me", headers=auth["kronan_admin"])),
+            ("GET", "/units", lambda: client.get("/units", headers=auth["kronan_admin"])),
+            ("GET", "/staff", lambda: client.get("/staff", headers=auth["kronan_admin"])),
+            ("GET", "/users", lambda: client.get("/users", headers=auth["kronan_admin"])),
+            ("GET", "/schedule/day", lambda: client.get("/schedule/day", params={"unitId": "u1", "date": DAY})),
+            ("GET", "/schedule/cache-stats", lambda: client.get("/schedule/cache-stats")),
+            ("GET", "/schedule/stream", lambda: client.get(
+                "/schedule/stream", params={"unitId": "u1"}, headers=auth["kronan_admin"])),
+            ("GET", "/schedule/changes", lambda: client.get("/schedule/changes", params={"unitId": "u1", "since": 0})),
+            ("GET", "/schedule/range", lambda: client.get(
+                "/schedule/range", params={"unitId": "u1", "from": DAY, "to": "2026-01-18"})),
+            ("GET", "/schedule/overview", lambda: client.get(
+                "/schedule/overview", params={"date": DAY}, headers=auth["kronan_admin"])),
+            ("GET", "/schedule/mine", lambda: client.get(
+                "/schedule/mine", params={"from": TODAY, "to": WEEK_END}, headers=auth["kronan_admin"])),
+            ("GET", "/roster", lambda: client.get(
+                "/roster", params={"unitId": "u1", "from": TODAY, "to": WEEK_END}, headers=auth["kronan_admin"])),
+            ("PUT", "/roster", lambda: client.put("/roster", headers=auth["kronan_admin"], json=[
+                {"unit_id": "u1", "date": WEEK_END, "role_type": "morning_red", "user_id": "s2"},
+                {"unit_id": "u1", "date": WEEK_END, "role_type": "night_blue", "user_id": None},
+            ])),
+            ("PATCH", "/task-instances/{template_id}", lambda: client.patch(
+                f"/task-instances/{template_id}", json={"date": DAY, "status": "completed", "signed_by": "emma"})),
+            # Batchen har budget per post; två storlekar visar att kostnaden är linjär
+            ("PATCH", "/task-instances", lambda: batch_patch(1), 1),
+            ("PATCH", "/task-instances", lambda: batch_patch(20), 20),
+            ("POST", "/tasks", lambda: client.post(
+                "/tasks", json={"unit_id": "u1", "title": "Ny", "category": "Care", "role_type": "morning_red"})),
+            ("POST", "/tasks/import", lambda: client.post(
+                "/tasks/import", files={"file": ("tasks.csv", io.BytesIO(import_csv.encode()), "text/csv")})),
+            ("DELETE", "/tasks/{task_id}", lambda: client.delete(f"/tasks/{doomed_id}")),
+        ]
+
+        exercised = set()
+        exercised_endpoints = set()
+        for method, path, call, *rest in scenarios:
+            items = rest[0] if rest else 0
+            authenticated_user_cache.clear()
+            day_schedule_cache.clear()
+            with query_budget.record_queries(*engines) as recorder:
+                response = call()
+            route = capture.route
+            label = f"{method} {path}" + (f" [items={items}]" if items else "")
+            exercised.add((method, path))
+            if route is not None:
+                exercised_endpoints.add(route.endpoint)
+            if response.status_code >= 400 or route is None:
+                print(f"ERROR  {label}: HTTP {response.status_code} {response.text[:200]}")
+                failures += 1
+                continue
+            limit = query_budget.get_budget(route.endpoint, items)
+            if limit is None:
+                # Redan rapporterad som MISSING BUDGET; antalet hjälper att sätta en
+                print(f"--     {label}: {len(recorder)} (no budget)")
+                continue
+            try:
+                query_budget.assert_within_budget(recorder, limit, f"{label} ({route.endpoint.__module__})")
+            except query_budget.QueryBudgetExceeded as exc:
+                print(f"OVER   {exc}")
+                failures += 1
+                continue
+            print(f"ok     {label}: {len(recorder)}/{limit}")
+
+    for route in declared_routes():
+        if route.endpoint in exercised_endpoints:
+            continue
+        for method in route.methods:
+            key = (method, route.path)
+            if key not in exercised and key not in NOT_EXERCISED:
+                print(f"UNTESTED {method} {route.path}: lägg till ett anrop i scripts/check_query_budgets.py")
+                failures += 1
+
+    print(f"{failures} problem(s)" if failures else "All routes within budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -76,6 +76,10 @@ export const api = {
         }
         return res.json();
     },
+    refreshToken: (refreshToken: string) => fetchFromApi('/token/refresh', {
+        method: 'POST',
+        body: JSON.stringify({ refresh_token: refreshToken })
+    }),
     getMe: async (token: string) => {
         const data = await fetchFromApi('/me', {
             headers: authHeaders(token)
@@ -140,6 +144,7 @@ export const api = {
 
 
     getDaySchedule: (unitId: string, date: string) => fetchFromApi(`/schedule/day?unitId=${unitId}&date=${date}`),
+    getScheduleRange: (unitId: string, from: string, to: string) => fetchFromApi(`/schedule/range?unitId=${unitId}&from=${from}&to=${to}`),
     updateTaskStatus: (templateId: string, data: any) => fetchFromApi(`/task-instances/${templateId}`, {
         method: 'PATCH',
         body: JSON.stringify({
@@ -147,6 +152,14 @@ export const api = {
             report_data: data.reportData // Map frontend camelCase to backend snake_case
         })
     }),
+    updateTaskStatuses: (updates: { templateId: string; data: any }[]) => fetchFromApi('/task-instances', {
+        method: 'PATCH',
+        body: JSON.stringify(updates.map(({ templateId, data }) => ({
+            ...data,
+            template_id: templateId,
+            report_data: data.reportData
+        })))
+    }),
     createTask: (task: any) => fetchFromApi('/tasks', {
         method: 'POST',
         body: JSON.stringify({